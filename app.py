@@ -1,15 +1,26 @@
 import os
 import secrets
-from flask import Flask, request, abort, jsonify , render_template, session , url_for , redirect
+import threading
+from flask import Flask, request, abort, jsonify , render_template, session , url_for , redirect, Response, stream_with_context, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from flask_migrate import Migrate
-from authlib.integrations.flask_client import OAuth
 from six.moves.urllib.parse import urlencode
 from datetime import datetime
 
-from models import db, setup_db, Actor, Movie
+from models import db, setup_db, helper_table, Actor, Movie, Job
 from auth.auth import *
+from changes import notifier, wait_for_changes, stream_changes, CHANGES_LONG_POLL_TIMEOUT
+from graph import cast_graph, GRAPH_MAX_HOPS
+from scheduling import booking_index, find_conflicts, parse_date
+from stats import current_stats, STATS_MAX_AGE
+from singleflight import SingleFlight
+from ratelimit import RateLimiter, RateLimited, RATELIMIT_ENABLED
+from jobs import enqueue, HANDLERS as JOB_HANDLERS
+from counts import total_count, page_bounds, count_headers
+from profiling import install as install_profiling, list_profiles, profiling_enabled, PROFILE_DIR
+from wire import respond, read_body, columns, wants_columns
+from snapshots import snapshots, actor_snapshot, movie_snapshot, load_actor, load_movie
+from sqlalchemy.exc import IntegrityError
 
 
 
@@ -18,25 +29,51 @@ def create_app(test_config=None):
     setup_db(app)
     CORS(app)
 
-    oauth = OAuth(app)
-
     secret = secrets.token_urlsafe(32)
     app.secret_key = secret
-    auth0 = oauth.register(
-        'auth0',
-        client_id= os.environ.get('CLIENT_ID'),
-        client_secret=os.environ.get('CLIENT_SECRET'),
-        api_base_url=os.environ.get('API_BASE_URL'),
-        access_token_url=os.environ.get('ACCESS_TOKEN_URL'),
-        authorize_url=os.environ.get('AUTHORIZE_URL'),
-        client_kwargs={
-            'scope': 'openid profile email',
-        },
-    )
+
+    # Authlib is slow to import and only the login flow needs it, so the
+    # Auth0 client is registered the first time it is used
+    auth0_lock = threading.Lock()
+    def get_auth0():
+        with auth0_lock:
+            if 'auth0' not in app.extensions:
+                from authlib.integrations.flask_client import OAuth
+                oauth = OAuth(app)
+                app.extensions['auth0'] = oauth.register(
+                    'auth0',
+                    client_id= os.environ.get('CLIENT_ID'),
+                    client_secret=os.environ.get('CLIENT_SECRET'),
+                    api_base_url=os.environ.get('API_BASE_URL'),
+                    access_token_url=os.environ.get('ACCESS_TOKEN_URL'),
+                    authorize_url=os.environ.get('AUTHORIZE_URL'),
+                    client_kwargs={
+                        'scope': 'openid profile email',
+                    },
+                )
+            return app.extensions['auth0']
+
     AUTH0_URL = os.environ.get('AUTH0_LOGIN_URL')
 
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+    # concurrent identical reads share one query and serialized body
+    flights = SingleFlight()
+    app.extensions['singleflight'] = flights
+
+    # per-client token buckets shared by all workers, checked by requires_auth
+    if RATELIMIT_ENABLED:
+        app.extensions['ratelimit'] = RateLimiter()
+
+    # wraps the app only when PROFILE_TOKEN or PROFILE_SAMPLE_RATE is set
+    install_profiling(app)
+
+    # on PostgreSQL each worker listens for the writes of the others, which
+    # keeps its row snapshots current
+    @app.before_first_request
+    def listen_for_changes():
+        notifier.start(app)
+
 
 
 
@@ -68,7 +105,7 @@ def create_app(test_config=None):
         session.clear()
         # Redirect user to logout endpoint
         params = {'returnTo': url_for('index', _external=True), 'client_id': '5FmE550Gvrv7iLRl1WxYleKWZx44su3a'}
-        return redirect(auth0.api_base_url + '/v2/logout?' + urlencode(params))
+        return redirect(get_auth0().api_base_url + '/v2/logout?' + urlencode(params))
 
 
 
@@ -77,11 +114,23 @@ def create_app(test_config=None):
     ##################################################################
 
 
-    # retrieves all the actors
+    # retrieves all the actors, or one page of them with ?page= and
+    # ?per_page=. HEAD only counts them.
     @app.route('/actors', methods=['GET'])
     @requires_auth('get:actors')
+    @flights.coalesce
     def show_actors(jwt):
-        actors = Actor.query.all()
+        if request.method == 'HEAD':
+            return Response(headers=count_headers(*total_count(Actor.__table__)))
+        try:
+            limit, offset = page_bounds(request.args)
+        except ValueError:
+            abort(400)
+
+        query = Actor.query
+        if limit is not None:
+            query = query.order_by(Actor.id).limit(limit).offset(offset)
+        actors = query.all()
         if actors is None:
             abort(404)
 
@@ -95,17 +144,34 @@ def create_app(test_config=None):
             })
 
 
-        return jsonify({
+        if wants_columns(request.args):
+            actors_list = columns(actors_list, ('actor_id', 'actor_name', 'actor_age', 'actor_gender'))
+        response = respond({
         'success': True,
         'actors': actors_list
         })
+        response.headers.extend(count_headers(
+            *(total_count(Actor.__table__) if limit is not None else (len(actors), True))))
+        return response
 
 
-    # retrieves all the movies
+    # retrieves all the movies, or one page of them with ?page= and
+    # ?per_page=. HEAD only counts them.
     @app.route('/movies', methods= ['GET'])
     @requires_auth('get:movies')
+    @flights.coalesce
     def show_movies(jwt):
-        movies = Movie.query.all()
+        if request.method == 'HEAD':
+            return Response(headers=count_headers(*total_count(Movie.__table__)))
+        try:
+            limit, offset = page_bounds(request.args)
+        except ValueError:
+            abort(400)
+
+        query = Movie.query
+        if limit is not None:
+            query = query.order_by(Movie.id).limit(limit).offset(offset)
+        movies = query.all()
         if movies is None:
             abort(404)
 
@@ -117,41 +183,52 @@ def create_app(test_config=None):
             'movie_release_date': movie.release_date
             })
 
-        return jsonify({
+        if wants_columns(request.args):
+            movies_list = columns(movies_list, ('movie_id', 'movie_title', 'movie_release_date'))
+        response = respond({
         'success': True,
         'movies': movies_list
         })
+        response.headers.extend(count_headers(
+            *(total_count(Movie.__table__) if limit is not None else (len(movies), True))))
+        return response
 
 
     # retrieves a certain actor
     @app.route('/actors/<int:actor_id>',methods=['GET'])
     @requires_auth('get:actor')
+    @flights.coalesce
     def show_actor(jwt, actor_id):
-        actor = Actor.query.filter(Actor.id == actor_id).one_or_none()
+        actor = actor_snapshot(actor_id)
         if actor is None:
             abort(404)
 
-        return jsonify({
+        response = respond({
         'success': True,
         'name': actor.name,
         'age': actor.age,
         'gender': actor.gender
         })
+        response.set_etag(str(actor.version))
+        return response
 
 
     # retrieves a certain movie
     @app.route('/movies/<int:movie_id>', methods=['GET'])
     @requires_auth('get:movie')
+    @flights.coalesce
     def show_movie(jwt, movie_id):
-        movie = Movie.query.filter(Movie.id == movie_id).one_or_none()
+        movie = movie_snapshot(movie_id)
         if movie is None:
             abort(404)
 
-        return jsonify({
+        response = respond({
         'success': True,
         'title': movie.title,
         'release_date': movie.release_date
         })
+        response.set_etag(str(movie.version))
+        return response
 
 
     ## Delete endpoints
@@ -162,14 +239,10 @@ def create_app(test_config=None):
     @requires_auth('delete:actor')
     def delete_actor(jwt, actor_id):
         try:
-            actor = Actor.query.filter(Actor.id == actor_id).one_or_none()
-
-            if actor is None:
+            if not Actor.delete_where(Actor.id == actor_id):
                 abort(404)
 
-            actor.delete()
-
-            return jsonify({
+            return respond({
             "success": True,
             "deleted": actor_id
             })
@@ -182,14 +255,10 @@ def create_app(test_config=None):
     @requires_auth('delete:movie')
     def delete_movie(jwt, movie_id):
         try:
-            movie = Movie.query.filter(Movie.id == movie_id).one_or_none()
-
-            if movie is None:
+            if not Movie.delete_where(Movie.id == movie_id):
                 abort(404)
 
-            movie.delete()
-
-            return jsonify({
+            return respond({
             "success": True,
             "deleted": movie_id
             })
@@ -197,20 +266,100 @@ def create_app(test_config=None):
             abort(422)
 
 
+    # builds the condition of a bulk delete from {"ids": [...]} or
+    # {"filter": {...}}, using the given filter builders
+    def bulk_condition(model, filters):
+        body = read_body(silent=True)
+        if not isinstance(body, dict) or ('ids' in body) == ('filter' in body):
+            abort(400)
+        try:
+            if 'ids' in body:
+                ids = body['ids']
+                # bools are ints to Python, and strings would be read one
+                # digit at a time
+                if not isinstance(ids, list) or not ids or any(
+                        type(entity_id) is not int for entity_id in ids):
+                    abort(400)
+                return model.id.in_(ids)
+
+            criteria = body['filter']
+            if not criteria or not isinstance(criteria, dict) or set(criteria) - set(filters):
+                abort(400)
+            return db.and_(*[filters[name](value) for name, value in criteria.items()])
+        except (AttributeError, TypeError, ValueError):
+            abort(400)
+
+
+    # deletes every actor listed or matching a filter on gender, min_age,
+    # max_age or movie_id, with one DELETE
+    @app.route('/actors', methods=['DELETE'])
+    @requires_auth('delete:actor')
+    def delete_actors(jwt):
+        condition = bulk_condition(Actor, {
+            'gender': lambda value: Actor.gender == value,
+            'min_age': lambda value: Actor.age >= int(value),
+            'max_age': lambda value: Actor.age <= int(value),
+            'movie_id': lambda value: Actor.id.in_(db.select([helper_table.c.actor_id]).where(
+                helper_table.c.movie_id == int(value)))
+        })
+        try:
+            deleted = Actor.delete_where(condition)
+        except:
+            abort(422)
+
+        return respond({
+        "success": True,
+        "deleted": deleted
+        })
+
+
+    # deletes every movie listed or matching a filter on released_before,
+    # released_after or actor_id, with one DELETE
+    @app.route('/movies', methods=['DELETE'])
+    @requires_auth('delete:movie')
+    def delete_movies(jwt):
+        condition = bulk_condition(Movie, {
+            'released_before': lambda value: Movie.release_date < parse_date(value),
+            'released_after': lambda value: Movie.release_date > parse_date(value),
+            'actor_id': lambda value: Movie.id.in_(db.select([helper_table.c.movie_id]).where(
+                helper_table.c.actor_id == int(value)))
+        })
+        try:
+            deleted = Movie.delete_where(condition)
+        except:
+            abort(422)
+
+        return respond({
+        "success": True,
+        "deleted": deleted
+        })
+
+
     ## POST endpoints
     ##################################################################
 
+    # the age in a request body as an int, as PostgreSQL would coerce it;
+    # 400 when it is not a whole number
+    def actor_age(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            abort(400)
+
+
     # adds a new actor
     @app.route('/actors', methods=['POST'])
     @requires_auth('post:actor')
     def add_actor(jwt):
-        body = request.get_json()
+        body = read_body()
         if body is None:
             abort(400)
 
         new_name = body.get('name', None)
         new_age = body.get('age', None)
         new_gender = body.get('gender', None)
+        if new_age is not None:
+            new_age = actor_age(new_age)
         try:
             if new_name and new_age and new_gender :
                 new_actor = Actor(
@@ -219,7 +368,7 @@ def create_app(test_config=None):
                 gender = new_gender
                 )
                 new_actor.insert()
-                return jsonify({
+                return respond({
                 'success': True,
                 'created_id': new_actor.id,
                 'actors': [actor.format() for actor in Actor.query.all()]
@@ -235,7 +384,7 @@ def create_app(test_config=None):
     @app.route('/movies', methods=['POST'])
     @requires_auth('post:movie')
     def add_movie(jwt):
-        body = request.get_json()
+        body = read_body()
         if body is None:
             abort(400)
 
@@ -248,7 +397,7 @@ def create_app(test_config=None):
                 new_movie = Movie(title=new_title, release_date= new_release_date)
 
                 new_movie.insert()
-                return jsonify({
+                return respond({
                 'success': True,
                 'created_id': new_movie.id,
                 'movies': [movie.format() for movie in Movie.query.all()]
@@ -262,76 +411,399 @@ def create_app(test_config=None):
 
     ## PATCH endpoints
     ##################################################################
-    # updates an existing actor
+
+    # versions listed in an If-Match header, None when there is none or it
+    # is "*"; only strong tags can match
+    def if_match_versions():
+        if not request.if_match or request.if_match.star_tag:
+            return None
+        return [int(tag) for tag in request.if_match.as_set() if tag.isdigit()]
+
+
+    # updates an existing actor; a stale If-Match gets 412
     @app.route('/actors/<int:actor_id>', methods=['PATCH'])
     @requires_auth('patch:actor')
     def update_actor(jwt, actor_id):
+        body = read_body()
+        if body is None:
+            abort(400)
+
+        values = {field: body[field] for field in ('name', 'age', 'gender') if body.get(field)}
+        if 'age' in values:
+            values['age'] = actor_age(values['age'])
+        try:
+            actor = Actor.update(actor_id, values, if_match_versions())
+        except:
+            abort(422)
 
-        actor = Actor.query.filter(Actor.id == actor_id).one_or_none()
         if actor is None:
-            abort(404)
+            abort(404 if load_actor(actor_id) is None else 412)
 
-        body = request.get_json()
+        response = respond({
+        "success": True,
+        "actor": [actor.format()]
+        })
+        response.set_etag(str(actor.version))
+        return response
+
+
+    # updates an existing movie; a stale If-Match gets 412
+    @app.route('/movies/<int:movie_id>', methods=['PATCH'])
+    @requires_auth('patch:movie')
+    def update_movie(jwt, movie_id):
+        body = read_body()
         if body is None:
             abort(400)
 
-        new_name = body.get('name', None)
-        new_age = body.get('age', None)
-        new_gender = body.get('gender', None)
+        values = {}
+        new_title = body.get('title', None)
+        new_release_date_str = body.get('release_date', None)
         try:
-            if new_name:
-                actor.name = new_name
+            if new_title:
+                values['title'] = new_title
 
-            if new_age:
-                actor.age = new_age
+            if new_release_date_str:
+                y, m , d = new_release_date_str.split('-')
+                values['release_date'] = datetime(int(y), int(m), int(d)).date()
 
-            if new_gender:
-                actor.gender = new_gender
+            movie = Movie.update(movie_id, values, if_match_versions())
+        except:
+            abort(422)
 
-            actor.update()
+        if movie is None:
+            abort(404 if load_movie(movie_id) is None else 412)
 
-            return jsonify({
-            "success": True,
-            "actor": [actor.format() for actor in Actor.query.all()]
-            })
-        except:
+        response = respond({
+        "success": True,
+        "movies": [movie.format()]
+        })
+        response.set_etag(str(movie.version))
+        return response
+
+
+
+    ## Cast endpoints
+    ##################################################################
+
+    # reads an optional shooting window from the request, both ends inclusive
+    def shooting_window(source, required=False):
+        start_str = source.get('start_date', None)
+        end_str = source.get('end_date', None)
+        if start_str is None and end_str is None and not required:
+            return None, None
+        try:
+            start_date, end_date = parse_date(start_str), parse_date(end_str)
+        except (AttributeError, ValueError):
+            abort(400)
+        if start_date > end_date:
+            abort(400)
+        return start_date, end_date
+
+
+    # casts an actor in a movie, optionally booking them for a shooting window
+    @app.route('/movies/<int:movie_id>/actors', methods=['POST'])
+    @requires_auth('patch:movie')
+    def add_cast(jwt, movie_id):
+        body = read_body()
+        # bools are ints to Python; anything but an int would reach the
+        # database as a bad parameter
+        if not isinstance(body, dict) or type(body.get('actor_id')) is not int:
+            abort(400)
+        start_date, end_date = shooting_window(body)
+
+        movie = Movie.query.get(movie_id)
+        actor = Actor.query.get(body['actor_id'])
+        if movie is None or actor is None:
+            abort(404)
+
+        if actor in movie.actors:
             abort(422)
 
+        if start_date and find_conflicts(actor.id, start_date, end_date):
+            abort(409)
 
-    # updates an existing movie
-    @app.route('/movies/<int:movie_id>', methods=['PATCH'])
+        try:
+            movie.add_actor(actor, start_date, end_date)
+        except IntegrityError:
+            # lost a race against a concurrent booking
+            db.session.rollback()
+            abort(409)
+
+        return respond({
+        'success': True,
+        'movie_id': movie_id,
+        'actors': [actor.id for actor in movie.actors]
+        })
+
+
+    # books an actor of the cast for a new shooting window
+    @app.route('/movies/<int:movie_id>/actors/<int:actor_id>', methods=['PATCH'])
     @requires_auth('patch:movie')
-    def update_movie(jwt, movie_id):
+    def schedule_cast(jwt, movie_id, actor_id):
+        body = read_body()
+        if body is None:
+            abort(400)
+        start_date, end_date = shooting_window(body, required=True)
 
-        movie = Movie.query.filter(Movie.id == movie_id).one_or_none()
+        movie = Movie.query.get(movie_id)
         if movie is None:
             abort(404)
 
-        body = request.get_json()
-        if body is None:
+        actor = next((actor for actor in movie.actors if actor.id == actor_id), None)
+        if actor is None:
+            abort(404)
+
+        if find_conflicts(actor_id, start_date, end_date, exclude_movie_id=movie_id):
+            abort(409)
+
+        try:
+            movie.schedule_actor(actor, start_date, end_date)
+        except IntegrityError:
+            db.session.rollback()
+            abort(409)
+
+        return respond({
+        'success': True,
+        'movie_id': movie_id,
+        'actor_id': actor_id,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat()
+        })
+
+
+    # removes an actor from a movie's cast
+    @app.route('/movies/<int:movie_id>/actors/<int:actor_id>', methods=['DELETE'])
+    @requires_auth('patch:movie')
+    def delete_cast(jwt, movie_id, actor_id):
+        movie = Movie.query.get(movie_id)
+        if movie is None:
+            abort(404)
+
+        actor = next((actor for actor in movie.actors if actor.id == actor_id), None)
+        if actor is None:
+            abort(404)
+
+        movie.remove_actor(actor)
+        return respond({
+        'success': True,
+        'movie_id': movie_id,
+        'actors': [actor.id for actor in movie.actors]
+        })
+
+
+    ## Availability endpoints
+    ##################################################################
+
+    # tells whether an actor is free for a whole shooting window
+    @app.route('/actors/<int:actor_id>/availability', methods=['GET'])
+    @requires_auth('get:actor')
+    @flights.coalesce
+    def show_availability(jwt, actor_id):
+        start_date, end_date = shooting_window(request.args, required=True)
+        if actor_snapshot(actor_id) is None:
+            abort(404)
+
+        conflicts = find_conflicts(actor_id, start_date, end_date)
+        return respond({
+        'success': True,
+        'actor_id': actor_id,
+        'available': not conflicts,
+        'conflicts': conflicts
+        })
+
+
+    # lists the actors free for a whole shooting window
+    @app.route('/actors/available', methods=['GET'])
+    @requires_auth('get:actors')
+    @flights.coalesce
+    def show_available_actors(jwt):
+        start_date, end_date = shooting_window(request.args, required=True)
+        with booking_index.lock:
+            booking_index.sync()
+            actors = booking_index.available(start_date, end_date)
+
+        return respond({
+        'success': True,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'actors': actors
+        })
+
+
+    ## Co-star graph endpoints
+    ##################################################################
+
+    # lists the actors within a number of shared movies of a certain actor
+    @app.route('/actors/<int:actor_id>/costars', methods=['GET'])
+    @requires_auth('get:actors')
+    @flights.coalesce
+    def show_costars(jwt, actor_id):
+        try:
+            hops = int(request.args.get('hops', 1))
+        except ValueError:
+            abort(400)
+        if not 1 <= hops <= GRAPH_MAX_HOPS:
             abort(400)
 
-        new_title = body.get('title', None)
-        new_release_date_str = body.get('release_date', None)
+        if actor_snapshot(actor_id) is None:
+            abort(404)
+
+        with cast_graph.lock:
+            cast_graph.sync()
+            costars = cast_graph.costars(actor_id, hops)
+
+        return respond({
+        'success': True,
+        'actor_id': actor_id,
+        'hops': hops,
+        'costars': [{'actor_id': costar_id, 'distance': distance}
+                    for costar_id, distance in sorted(costars.items(), key=lambda item: (item[1], item[0]))]
+        })
+
+
+    # degrees of separation between two actors, with one shortest chain of
+    # actor, movie, actor, ... linking them
+    @app.route('/actors/<int:actor_id>/separation/<int:other_id>', methods=['GET'])
+    @requires_auth('get:actors')
+    @flights.coalesce
+    def show_separation(jwt, actor_id, other_id):
+        with cast_graph.lock:
+            cast_graph.sync()
+            path = cast_graph.shortest_path(actor_id, other_id)
+        if path is None:
+            abort(404)
+
+        return respond({
+        'success': True,
+        'degrees': len(path) // 2,
+        'path': [{'movie_id' if i % 2 else 'actor_id': node_id} for i, node_id in enumerate(path)]
+        })
+
 
+    ## Statistics
+    ##################################################################
+
+    # catalogue counters, at most STATS_MAX_AGE seconds old
+    @app.route('/stats', methods=['GET'])
+    @requires_auth('get:stats')
+    @flights.coalesce
+    def show_stats(jwt):
+        stats, as_of = current_stats()
+        return respond({
+        'success': True,
+        'stats': stats,
+        'as_of': as_of.isoformat() + 'Z',
+        'max_age': STATS_MAX_AGE
+        })
+
+
+    ## Change feed
+    ##################################################################
+
+    # lists changes after a cursor, waiting for new ones when there are none.
+    # Clients sending "Accept: text/event-stream" get a Server-Sent Events
+    # stream instead, resumable through the Last-Event-ID header.
+    @app.route('/changes', methods=['GET'])
+    @requires_auth('get:changes')
+    def show_changes(jwt):
+        since = request.args.get('since', request.headers.get('Last-Event-ID', 0))
+        wait = request.args.get('wait', CHANGES_LONG_POLL_TIMEOUT)
         try:
-            if new_title:
-                movie.title = new_title
+            since = int(since)
+            wait = min(max(float(wait), 0), CHANGES_LONG_POLL_TIMEOUT)
+        except ValueError:
+            abort(400)
 
-            if new_release_date_str:
-                y, m , d = new_release_date_str.split('-')
-                new_release_date = datetime(int(y), int(m), int(d)).date()
-                movie.release_date = new_release_date
+        if request.accept_mimetypes.best == 'text/event-stream':
+            return Response(stream_with_context(stream_changes(app, since)),
+                            mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+        changes = wait_for_changes(app, since, wait)
+        return respond({
+        'success': True,
+        'changes': changes,
+        'cursor': changes[-1]['cursor'] if changes else since
+        })
 
-            movie.update()
 
-            return jsonify({
-            "success": True,
-            "movies": [movie.format() for movie in Movie.query.all()]
-            })
-        except:
-            abort(422)
+    ## Background jobs
+    ##################################################################
+
+    # queues an export, import or statistics rebuild for the job worker
+    @app.route('/jobs', methods=['POST'])
+    @requires_auth('post:jobs')
+    def add_job(jwt):
+        body = read_body(silent=True) or {}
+        kind = body.get('kind')
+        payload = body.get('payload', {})
+        if kind not in JOB_HANDLERS or not isinstance(payload, dict):
+            abort(400)
 
+        job = enqueue(kind, payload)
+        response = respond({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status
+        })
+        response.headers['Location'] = url_for('show_job', job_id=job.id)
+        return response, 202
+
+
+    # progress of a job, and its result once it has finished
+    @app.route('/jobs/<int:job_id>', methods=['GET'])
+    @requires_auth('get:jobs')
+    def show_job(jwt, job_id):
+        job = Job.query.get(job_id)
+        if job is None:
+            abort(404)
+
+        return respond({
+        'success': True,
+        'job': job.format()
+        })
+
+
+    ## Profiles
+    ##################################################################
+
+    # profiles recorded on this host, newest first
+    @app.route('/profiles', methods=['GET'])
+    @requires_auth('get:profiles')
+    def show_profiles(jwt):
+        return respond({
+        'success': True,
+        'enabled': profiling_enabled(),
+        'profiles': list_profiles()
+        })
+
+
+    # downloads a profile: pstats data or collapsed stacks
+    @app.route('/profiles/<name>', methods=['GET'])
+    @requires_auth('get:profiles')
+    def download_profile(jwt, name):
+        return send_from_directory(PROFILE_DIR, name, as_attachment=True)
+
+
+    ## Metrics
+    ##################################################################
+
+    # per-worker counters of the request-level optimizations
+    @app.route('/metrics', methods=['GET'])
+    @requires_auth('get:metrics')
+    def show_metrics(jwt):
+        metrics = {
+        'success': True,
+        'pid': os.getpid(),
+        'singleflight': flights.snapshot(),
+        'snapshots': snapshots.snapshot()
+        }
+        if 'ratelimit' in app.extensions:
+            metrics['ratelimit'] = app.extensions['ratelimit'].snapshot()
+        # present when served through the ASGI entry point
+        if 'async_singleflight' in app.extensions:
+            metrics['async_singleflight'] = app.extensions['async_singleflight'].snapshot()
+        return respond(metrics)
 
 
     ## Error Handling
@@ -352,6 +824,33 @@ def create_app(test_config=None):
                         "message": "resource not found"
                         }), 404
 
+    @app.errorhandler(409)
+    def conflict(error):
+        return jsonify({
+                        "success": False,
+                        "error": 409,
+                        "message": "conflict"
+                        }), 409
+
+
+    @app.errorhandler(412)
+    def precondition_failed(error):
+        return jsonify({
+                        "success": False,
+                        "error": 412,
+                        "message": "precondition failed"
+                        }), 412
+
+
+    @app.errorhandler(RateLimited)
+    def rate_limited(error):
+        response = jsonify({
+                        "success": False,
+                        "error": error.status_code,
+                        "message": "too many requests" if error.status_code == 429 else "service unavailable"
+                        })
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response, error.status_code
 
     @app.errorhandler(AuthError)
     def authentication_error(error):
@@ -373,6 +872,24 @@ def create_app(test_config=None):
 
     return app
 
+# Fills the per-process caches so that, when gunicorn preloads the app,
+# workers inherit them copy-on-write instead of each building their own.
+# Database connections are closed afterwards so no socket is shared
+# across the fork.
+def warm_up(app):
+    with app.app_context():
+        app.jinja_env.get_template('login.html')
+        try:
+            get_jwks()
+        except Exception:
+            app.logger.warning('could not prefetch the JWKS', exc_info=True)
+        cast_graph.sync()
+        booking_index.sync()
+        current_stats()
+        db.session.remove()
+        db.get_engine(app).dispose()
+
+
 app = create_app()
 
 if __name__ == '__main__':
@@ -0,0 +1,247 @@
+import os
+from flask import json
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import Response
+from starlette.routing import Route, Mount
+from sqlalchemy import select
+import databases
+
+from app import app as flask_app
+from models import database_url, Actor, Movie
+from auth.auth import AuthError
+from ratelimit import RateLimited
+from auth.async_auth import requires_auth_async, close_client
+from singleflight import AsyncSingleFlight
+from counts import total_count_async, page_bounds, count_headers
+from wire import prefers_msgpack, pack, columns, wants_columns, MSGPACK_MIMETYPE
+
+
+'''
+ASGI entry point
+Serves the read endpoints natively on an event loop, with an async database
+driver (asyncpg / aiosqlite through `databases`) and async key fetching, so
+a single process can hold thousands of concurrent connections:
+
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+
+Every other route is handed to the Flask app from create_app through a
+thread pool, so all endpoints, payloads and error responses stay the same.
+'''
+
+
+def async_database_url(url):
+    # Heroku style URLs use the legacy postgres:// scheme
+    if url and url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+ASYNC_DB_MIN_SIZE = int(os.environ.get('ASYNC_DB_MIN_SIZE', 1))
+ASYNC_DB_MAX_SIZE = int(os.environ.get('ASYNC_DB_MAX_SIZE', 20))
+
+database = databases.Database(
+    async_database_url(database_url),
+    **({'min_size': ASYNC_DB_MIN_SIZE, 'max_size': ASYNC_DB_MAX_SIZE}
+       if async_database_url(database_url).startswith('postgresql') else {})
+)
+actors_table = Actor.__table__
+movies_table = Movie.__table__
+flights = AsyncSingleFlight()
+flask_app.extensions['async_singleflight'] = flights
+
+
+def cors_headers(headers=None):
+    return dict(headers or {}, **{
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Headers': 'Content-Type,Authorization,true',
+        'Access-Control-Allow-Methods': 'GET,PUT,POST,DELETE,OPTIONS'
+    })
+
+
+# mirrors flask.jsonify: sorted keys, compact separators, trailing newline
+def json_response(payload, status_code=200):
+    body = json.dumps(payload, separators=(',', ':'), sort_keys=True) + '\n'
+    return Response(body, status_code=status_code, media_type='application/json', headers=cors_headers())
+
+
+# mirrors wire.respond: JSON unless the client prefers MessagePack
+def negotiated_response(request, payload):
+    if prefers_msgpack(request.headers.get('accept')):
+        response = Response(pack(payload), media_type=MSGPACK_MIMETYPE, headers=cors_headers())
+    else:
+        response = json_response(payload)
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+def error_response(status_code, message):
+    return json_response({
+        "success": False,
+        "error": status_code,
+        "message": message
+        }, status_code)
+
+
+def read_endpoint(permission):
+    def decorator(f):
+        async def endpoint(request):
+            try:
+                jwt = await requires_auth_async(request, permission)
+            except AuthError:
+                return error_response(401, 'AuthError')
+
+            # same shared buckets and client keys as the Flask routes; load
+            # shedding stays with the Flask side, which owns the SQLAlchemy
+            # pool. Taking a token locks a file, so it runs off the loop.
+            limiter = flask_app.extensions.get('ratelimit')
+            if limiter is not None:
+                client = limiter.key_for(jwt, request.client.host if request.client else None,
+                                         request.headers.getlist('x-forwarded-for'))
+                try:
+                    await run_in_threadpool(limiter.limit, permission, client)
+                except RateLimited as error:
+                    response = error_response(429, 'too many requests')
+                    response.headers['Retry-After'] = str(error.retry_after)
+                    return response
+
+            key = (
+                request.method,
+                request.url.path,
+                tuple(sorted(request.query_params.multi_items())),
+                prefers_msgpack(request.headers.get('accept')),
+                tuple(sorted(jwt.get('permissions', [])))
+            )
+            return await flights.do(key, lambda: f(request))
+
+        endpoint.__name__ = f.__name__
+        return endpoint
+    return decorator
+
+
+## GET endpoints
+##################################################################
+
+# retrieves all the actors, or one page of them; HEAD only counts them
+@read_endpoint('get:actors')
+async def show_actors(request):
+    if request.method == 'HEAD':
+        count, exact = await total_count_async(database, actors_table)
+        return Response(headers=cors_headers(count_headers(count, exact)))
+    try:
+        limit, offset = page_bounds(request.query_params)
+    except ValueError:
+        return error_response(400, 'bad request')
+
+    query = select([
+        actors_table.c.id, actors_table.c.name, actors_table.c.age, actors_table.c.gender])
+    if limit is not None:
+        query = query.order_by(actors_table.c.id).limit(limit).offset(offset)
+    actors = await database.fetch_all(query)
+    actors_list = [{
+        'actor_id': actor['id'],
+        'actor_name': actor['name'],
+        'actor_age': actor['age'],
+        'actor_gender': actor['gender']
+        } for actor in actors]
+    if wants_columns(request.query_params):
+        actors_list = columns(actors_list, ('actor_id', 'actor_name', 'actor_age', 'actor_gender'))
+    response = negotiated_response(request, {
+    'success': True,
+    'actors': actors_list
+    })
+    count, exact = await total_count_async(database, actors_table) if limit is not None else (len(actors), True)
+    response.headers.update(count_headers(count, exact))
+    return response
+
+
+# retrieves all the movies, or one page of them; HEAD only counts them
+@read_endpoint('get:movies')
+async def show_movies(request):
+    if request.method == 'HEAD':
+        count, exact = await total_count_async(database, movies_table)
+        return Response(headers=cors_headers(count_headers(count, exact)))
+    try:
+        limit, offset = page_bounds(request.query_params)
+    except ValueError:
+        return error_response(400, 'bad request')
+
+    query = select([
+        movies_table.c.id, movies_table.c.title, movies_table.c.release_date])
+    if limit is not None:
+        query = query.order_by(movies_table.c.id).limit(limit).offset(offset)
+    movies = await database.fetch_all(query)
+    movies_list = [{
+        'movie_id': movie['id'],
+        'movie_title': movie['title'],
+        'movie_release_date': movie['release_date']
+        } for movie in movies]
+    if wants_columns(request.query_params):
+        movies_list = columns(movies_list, ('movie_id', 'movie_title', 'movie_release_date'))
+    response = negotiated_response(request, {
+    'success': True,
+    'movies': movies_list
+    })
+    count, exact = await total_count_async(database, movies_table) if limit is not None else (len(movies), True)
+    response.headers.update(count_headers(count, exact))
+    return response
+
+
+# retrieves a certain actor
+@read_endpoint('get:actor')
+async def show_actor(request):
+    actor = await database.fetch_one(select([
+        actors_table.c.name, actors_table.c.age, actors_table.c.gender, actors_table.c.version]).where(
+        actors_table.c.id == request.path_params['actor_id']))
+    if actor is None:
+        return error_response(404, 'resource not found')
+
+    response = negotiated_response(request, {
+    'success': True,
+    'name': actor['name'],
+    'age': actor['age'],
+    'gender': actor['gender']
+    })
+    response.headers['ETag'] = f'"{actor["version"]}"'
+    return response
+
+
+# retrieves a certain movie
+@read_endpoint('get:movie')
+async def show_movie(request):
+    movie = await database.fetch_one(select([
+        movies_table.c.title, movies_table.c.release_date, movies_table.c.version]).where(
+        movies_table.c.id == request.path_params['movie_id']))
+    if movie is None:
+        return error_response(404, 'resource not found')
+
+    response = negotiated_response(request, {
+    'success': True,
+    'title': movie['title'],
+    'release_date': movie['release_date']
+    })
+    response.headers['ETag'] = f'"{movie["version"]}"'
+    return response
+
+
+async def startup():
+    await database.connect()
+
+
+async def shutdown():
+    await database.disconnect()
+    await close_client()
+
+
+app = Starlette(
+    routes=[
+        Route('/actors', show_actors, methods=['GET']),
+        Route('/movies', show_movies, methods=['GET']),
+        Route('/actors/{actor_id:int}', show_actor, methods=['GET']),
+        Route('/movies/{movie_id:int}', show_movie, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    on_startup=[startup],
+    on_shutdown=[shutdown],
+)
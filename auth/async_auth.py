@@ -0,0 +1,56 @@
+import asyncio
+import httpx
+from jose import jwt
+
+from .auth import AuthError, JWKS_URL, parse_auth_header, check_permissions, decode_jwt, cached_jwks, store_jwks
+
+
+## Async counterparts of requires_auth
+'''
+Used by the ASGI entry point. Key fetching goes through an async HTTP client
+and shares the JWKS cache of the sync code path.
+'''
+_client = None
+_refresh_lock = None
+
+
+async def get_jwks_async(kid=None):
+    global _client, _refresh_lock
+    jwks = cached_jwks(kid)
+    if jwks is not None:
+        return jwks
+
+    if _refresh_lock is None:
+        _refresh_lock = asyncio.Lock()
+        _client = httpx.AsyncClient(timeout=10)
+    async with _refresh_lock:
+        jwks = cached_jwks(kid)
+        if jwks is None:
+            response = await _client.get(JWKS_URL)
+            response.raise_for_status()
+            jwks = store_jwks(response.json())
+        return jwks
+
+
+async def verify_decode_jwt_async(token):
+    unverified_header = jwt.get_unverified_header(token)
+    return decode_jwt(token, await get_jwks_async(unverified_header.get('kid')))
+
+
+async def requires_auth_async(request, permission=''):
+    token = parse_auth_header(request.headers.get('Authorization', None))
+    try:
+        payload = await verify_decode_jwt_async(token)
+    except:
+        raise AuthError({
+        'code': 'invalid_header',
+        'description': 'Unable to find the appropriate key.'
+        }, 401)
+
+    check_permissions(permission, payload)
+    return payload
+
+
+async def close_client():
+    if _client is not None:
+        await _client.aclose()
@@ -1,6 +1,8 @@
 import os
 import json
-from flask import request, _request_ctx_stack
+import threading
+import time
+from flask import request, current_app, _request_ctx_stack
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
@@ -9,6 +11,11 @@ from urllib.request import urlopen
 AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN')
 ALGORITHMS = os.environ.get('ALGORITHMS')
 API_AUDIENCE = os.environ.get('API_AUDIENCE')
+JWKS_URL = f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'
+# seconds the signing keys are reused before being fetched again
+JWKS_CACHE_TTL = float(os.environ.get('JWKS_CACHE_TTL', 600))
+# minimum seconds between refreshes caused by tokens with an unknown key id
+JWKS_MIN_REFRESH = float(os.environ.get('JWKS_MIN_REFRESH', 30))
 
 ## AuthError Exception
 '''
@@ -24,7 +31,10 @@ class AuthError(Exception):
 ## Auth Header
 
 def get_token_auth_header():
-    auth = request.headers.get('Authorization', None)
+    return parse_auth_header(request.headers.get('Authorization', None))
+
+
+def parse_auth_header(auth):
     if not auth:
         raise AuthError({
             'code': 'authorization_header_missing',
@@ -69,10 +79,50 @@ def check_permissions(permission, payload):
 
 
 
+## JWKS cache
+'''
+Auth0 rotates its signing keys rarely, so they are kept for JWKS_CACHE_TTL
+seconds instead of being downloaded for every request. A token signed by a
+key we have not seen forces a refresh, at most every JWKS_MIN_REFRESH seconds.
+'''
+_jwks_cache = {'jwks': None, 'fetched': 0}
+_jwks_lock = threading.Lock()
+
+
+def cached_jwks(kid):
+    jwks = _jwks_cache['jwks']
+    age = time.monotonic() - _jwks_cache['fetched']
+    if jwks is None or age > JWKS_CACHE_TTL:
+        return None
+    if age > JWKS_MIN_REFRESH and not any(key['kid'] == kid for key in jwks['keys']):
+        return None
+    return jwks
+
+
+def store_jwks(jwks):
+    _jwks_cache['jwks'] = jwks
+    _jwks_cache['fetched'] = time.monotonic()
+    return jwks
+
+
+def get_jwks(kid=None):
+    jwks = cached_jwks(kid)
+    if jwks is not None:
+        return jwks
+    with _jwks_lock:
+        jwks = cached_jwks(kid)
+        if jwks is None:
+            jsonurl = urlopen(JWKS_URL)
+            jwks = store_jwks(json.loads(jsonurl.read()))
+        return jwks
+
+
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    unverified_header = jwt.get_unverified_header(token)
+    return decode_jwt(token, get_jwks(unverified_header.get('kid')))
+
 
+def decode_jwt(token, jwks):
     unverified_header = jwt.get_unverified_header(token)
 
     rsa_key = {}
@@ -140,6 +190,9 @@ def requires_auth(permission=''):
                 }, 401)
 
             check_permissions(permission, payload)
+            limiter = current_app.extensions.get('ratelimit')
+            if limiter is not None:
+                limiter.check(permission, payload)
             return f(payload, *args, **kwargs)
 
         return wrapper
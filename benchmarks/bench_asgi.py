@@ -0,0 +1,61 @@
+'''
+Sync vs ASGI serving benchmark
+Drives a running server with many concurrent connections and reports
+throughput and latency. Start each mode against the same database, e.g.
+
+    gunicorn -w 4 -b 127.0.0.1:8001 app:app
+    gunicorn -w 4 -k uvicorn.workers.UvicornWorker -b 127.0.0.1:8002 asgi:app
+
+then run, with a token allowed to read actors in $ASSISTANT:
+
+    python benchmarks/bench_asgi.py http://127.0.0.1:8001/actors/1 --concurrency 1000
+    python benchmarks/bench_asgi.py http://127.0.0.1:8002/actors/1 --concurrency 1000
+'''
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+
+async def worker(client, url, headers, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(url, headers=headers)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+            else:
+                latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError as error:
+            errors.append(type(error).__name__)
+
+
+async def run(url, concurrency, duration, token):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies, errors = [], []
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(worker(client, url, headers, deadline, latencies, errors)
+                               for _ in range(concurrency)))
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+    print(f'{url}  concurrency={concurrency}  duration={duration}s')
+    print(f'  requests/s   {len(latencies) / duration:10.1f}')
+    print(f'  p50 latency  {percentile(0.50):10.1f} ms')
+    print(f'  p99 latency  {percentile(0.99):10.1f} ms')
+    print(f'  errors       {len(errors):10d}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('url')
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--token', default=os.environ.get('ASSISTANT'))
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.concurrency, args.duration, args.token))
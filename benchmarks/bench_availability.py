@@ -0,0 +1,64 @@
+'''
+Availability benchmark
+Loads a synthetic schedule into the in-process booking index and times the
+"which actors are free between A and B" query. Runs without a database:
+
+    python benchmarks/bench_availability.py [actors] [bookings_per_actor]
+'''
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from scheduling import BookingIndex
+
+
+def main(actors=5000, per_actor=20, seed=11):
+    rng = random.Random(seed)
+    first_day = date(2020, 1, 1).toordinal()
+    bookings = []
+    movie_id = 0
+    for actor_id in range(1, actors + 1):
+        day = first_day
+        for _ in range(per_actor):
+            movie_id += 1
+            day += rng.randint(1, 30)
+            length = rng.randint(3, 40)
+            bookings.append((day, day + length, actor_id, movie_id))
+            day += length
+    print(f'{actors} actors, {len(bookings)} bookings')
+
+    index = BookingIndex()
+    start = time.perf_counter()
+    index.load(range(1, actors + 1), bookings, 0)
+    print(f'{"build interval tree":<32} {(time.perf_counter() - start) * 1000:10.2f} ms')
+
+    windows = []
+    for _ in range(100):
+        window_start = date.fromordinal(first_day + rng.randint(0, 900))
+        windows.append((window_start, window_start + timedelta(days=rng.randint(1, 30))))
+
+    start = time.perf_counter()
+    free = [len(index.available(a, b)) for a, b in windows]
+    elapsed = (time.perf_counter() - start) / len(windows)
+    print(f'{"available actors (per query)":<32} {elapsed * 1000:10.2f} ms'
+          f'   ~{sum(free) // len(free)} free on average')
+
+    for actor_id in rng.sample(range(1, actors + 1), 500):
+        movie_id += 1
+        day = first_day + rng.randint(0, 900)
+        index.book(actor_id, movie_id, day, day + 5)
+    start = time.perf_counter()
+    for a, b in windows:
+        index.available(a, b)
+    elapsed = (time.perf_counter() - start) / len(windows)
+    print(f'{"with 500 pending bookings":<32} {elapsed * 1000:10.2f} ms')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
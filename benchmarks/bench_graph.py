@@ -0,0 +1,68 @@
+'''
+Co-star graph benchmark
+Builds the CSR index for a synthetic catalogue of about a million cast links
+and times index construction, k-hop neighbourhoods, shortest paths and
+incremental link updates. Runs without a database:
+
+    python benchmarks/bench_graph.py [edges]
+'''
+import os
+import random
+import resource
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from graph import CastGraph
+
+
+def timed(label, fn, per=1):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - start) / per
+    print(f'{label:<40} {elapsed * 1000:10.3f} ms')
+    return result
+
+
+def main(edges=1000000, cast_size=10, seed=7):
+    rng = random.Random(seed)
+    movies = edges // cast_size
+    actors = movies * 2
+    actor_ids, movie_ids = array('l'), array('l')
+    for movie_id in range(1, movies + 1):
+        for actor_id in rng.sample(range(1, actors + 1), cast_size):
+            actor_ids.append(actor_id)
+            movie_ids.append(movie_id)
+    print(f'{len(actor_ids)} links, {actors} actors, {movies} movies')
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    graph = CastGraph()
+    timed('build CSR index', lambda: graph.load(actor_ids, movie_ids, 0))
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'{"peak RSS growth":<40} {(rss_after - rss_before) / 1024:10.1f} MB')
+
+    sample = [rng.randint(1, actors) for _ in range(200)]
+    for hops in (1, 2, 3):
+        # three hops reach most of a random graph, so sample fewer actors
+        actors_sample = sample if hops < 3 else sample[:20]
+        timed(f'costars hops={hops} (per query)',
+              lambda: [graph.costars(actor_id, hops) for actor_id in actors_sample], per=len(actors_sample))
+    pairs = [(rng.randint(1, actors), rng.randint(1, actors)) for _ in range(200)]
+    timed('shortest path (per random pair)',
+          lambda: [graph.shortest_path(a, b) for a, b in pairs], per=len(pairs))
+
+    def churn():
+        for _ in range(10000):
+            graph.add_edge(rng.randint(1, actors), rng.randint(1, movies))
+            graph.remove_edge(rng.randint(1, actors), rng.randint(1, movies))
+    timed('10k link inserts + 10k removals', churn)
+    timed('costars hops=2 with pending edits',
+          lambda: [graph.costars(actor_id, 2) for actor_id in sample], per=len(sample))
+    timed('compact', graph.compact)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,58 @@
+'''
+Primary-key lookup benchmark
+Times one actor lookup by id through the query the routes used to build on
+every call, through the identity-map get, through the baked query, and as
+a hit in the per-worker snapshot cache. Uses a throwaway SQLite database
+unless DATABASE_URL is set:
+
+    python benchmarks/bench_lookup.py [actors] [lookups]
+'''
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite'))
+os.environ.setdefault('RATELIMIT_ENABLED', '0')
+
+from app import app
+from models import db, Actor
+from snapshots import actor_snapshot, load_actor
+
+
+def timed(label, lookup, ids):
+    start = time.perf_counter()
+    for actor_id in ids:
+        lookup(actor_id)
+        # every request starts with an empty session
+        db.session.remove()
+    elapsed = (time.perf_counter() - start) / len(ids)
+    print(f'{label:<36} {elapsed * 1e6:10.1f} us')
+
+
+def main(actors=10000, lookups=20000, seed=5):
+    rng = random.Random(seed)
+    with app.app_context():
+        db.create_all()
+        if not Actor.query.count():
+            db.session.bulk_insert_mappings(Actor, [
+                {'name': f'actor {i}', 'age': rng.randint(18, 80), 'gender': rng.choice('mf')}
+                for i in range(actors)])
+            db.session.commit()
+        ids = [rng.randint(1, actors) for _ in range(lookups)]
+        hot = ids[:min(len(ids), 2000)]
+        for actor_id in hot:
+            actor_snapshot(actor_id)
+        db.session.remove()
+
+        print(f'{actors} actors, {lookups} lookups ({db.engine.dialect.name})')
+        timed('query.filter(...).one_or_none()', lambda actor_id: Actor.query.filter(Actor.id == actor_id).one_or_none(), ids)
+        timed('query.get()', lambda actor_id: Actor.query.get(actor_id), ids)
+        timed('baked query', load_actor, ids)
+        timed('snapshot cache hit', actor_snapshot, hot * (len(ids) // len(hot)))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,73 @@
+'''
+Startup and per-worker memory benchmark
+Times a cold `import app` and starts gunicorn with and without preloading
+to compare the memory each worker really costs (PSS and private pages from
+/proc/<pid>/smaps_rollup, Linux only). Needs DATABASE_URL:
+
+    python benchmarks/bench_startup.py [workers]
+'''
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def import_time(repeat=5):
+    code = 'import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)'
+    samples = [float(subprocess.check_output([sys.executable, '-c', code], cwd=ROOT))
+               for _ in range(repeat)]
+    return statistics.median(samples)
+
+
+def smaps(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as rollup:
+        for line in rollup:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def worker_memory(workers, preload, port):
+    env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0', WEB_CONCURRENCY=str(workers))
+    master = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                               '-b', f'127.0.0.1:{port}', 'app:app'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        start = time.perf_counter()
+        while len(children(master.pid)) < workers:
+            if master.poll() is not None:
+                raise RuntimeError('gunicorn exited')
+            time.sleep(0.05)
+        ready = time.perf_counter() - start
+        time.sleep(1)
+        rows = [smaps(pid) for pid in children(master.pid)]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+    return ready, rows
+
+
+def main(workers=4):
+    print(f'{"cold import app":<28} {import_time() * 1000:8.1f} ms')
+    for port, preload in ((8101, False), (8102, True)):
+        ready, rows = worker_memory(workers, preload, port)
+        label = 'preload' if preload else 'no preload'
+        print(f'{label}: {workers} workers up in {ready * 1000:.0f} ms')
+        for name in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+            average = sum(row.get(name, 0) for row in rows) / len(rows) / 1024
+            print(f'  {name:<26} {average:8.1f} MB per worker')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4)
@@ -0,0 +1,61 @@
+'''
+Wire format benchmark
+Compares the body size and the encode / decode time of the GET /actors
+payload as jsonify produces it and as MessagePack, in the row and the
+columnar layout. Runs without a database:
+
+    python benchmarks/bench_wire.py [actors]
+'''
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import msgpack
+from flask import Flask, jsonify
+
+from wire import pack, columns
+
+FIELDS = ('actor_id', 'actor_name', 'actor_age', 'actor_gender')
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main(actors=10000, repeat=20, seed=3):
+    rng = random.Random(seed)
+    rows = [{
+        'actor_id': actor_id,
+        'actor_name': f'Actor {rng.randint(0, 10 ** 9)}',
+        'actor_age': rng.randint(18, 80),
+        'actor_gender': rng.choice('mf')
+        } for actor_id in range(1, actors + 1)]
+    rows_payload = {'success': True, 'actors': rows}
+    columns_payload = {'success': True, 'actors': columns(rows, FIELDS)}
+
+    app = Flask(__name__)
+    with app.app_context():
+        cases = [
+            ('jsonify, rows', lambda: jsonify(rows_payload).get_data(), json.loads),
+            ('jsonify, columns', lambda: jsonify(columns_payload).get_data(), json.loads),
+            ('msgpack, rows', lambda: pack(rows_payload), msgpack.unpackb),
+            ('msgpack, columns', lambda: pack(columns_payload), msgpack.unpackb),
+        ]
+        print(f'{actors} actors')
+        print(f'{"":<20} {"bytes":>10} {"encode ms":>10} {"decode ms":>10}')
+        for label, encode, decode in cases:
+            body, encode_time = timed(encode, repeat)
+            _, decode_time = timed(lambda: decode(body), repeat)
+            print(f'{label:<20} {len(body):>10} {encode_time * 1000:>10.2f} {decode_time * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
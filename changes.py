@@ -0,0 +1,174 @@
+import os
+import select
+import threading
+import time
+from flask import json
+from sqlalchemy import event
+
+from models import db, Change, CHANGES_CHANNEL
+
+
+CHANGES_LONG_POLL_TIMEOUT = float(os.environ.get('CHANGES_LONG_POLL_TIMEOUT', 25))
+CHANGES_STREAM_MAX_AGE = float(os.environ.get('CHANGES_STREAM_MAX_AGE', 25))
+CHANGES_POLL_INTERVAL = float(os.environ.get('CHANGES_POLL_INTERVAL', 1))
+CHANGES_KEEPALIVE = float(os.environ.get('CHANGES_KEEPALIVE', 10))
+CHANGES_PAGE_SIZE = int(os.environ.get('CHANGES_PAGE_SIZE', 500))
+
+
+'''
+ChangeNotifier
+Wakes up requests waiting for new change log entries. Commits made by this
+process are published straight away; on PostgreSQL a background LISTEN
+connection also publishes the commits of every other worker. Subscribers
+get a (cursor, entity, entity_id) tuple for each change they see, and their
+optional reset callback is called whenever the LISTEN connection is
+(re)established, since notifications sent before then were missed.
+'''
+class ChangeNotifier:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._latest = 0
+        self._subscribers = []
+        self._resets = []
+        self._listener_pid = None
+        self._connected_pid = None
+
+    @property
+    def listening(self):
+        return self._listener_pid == os.getpid()
+
+    # true while this process holds a working LISTEN connection
+    @property
+    def connected(self):
+        return self._connected_pid == os.getpid()
+
+    def subscribe(self, callback, reset=None):
+        self._subscribers.append(callback)
+        if reset is not None:
+            self._resets.append(reset)
+
+    def publish(self, changes):
+        if not changes:
+            return
+        with self._cond:
+            self._latest = max(self._latest, max(change[0] for change in changes))
+            self._cond.notify_all()
+        for callback in self._subscribers:
+            callback(changes)
+
+    def wait(self, since, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._latest > since, timeout)
+
+    def start(self, app):
+        # the LISTEN thread belongs to a single process; a forked worker
+        # starts its own on first use
+        if self.listening:
+            return
+        with app.app_context():
+            engine = db.get_engine(app)
+        if engine.dialect.name != 'postgresql':
+            return
+        self._listener_pid = os.getpid()
+        thread = threading.Thread(target=self._listen, args=(engine,), daemon=True)
+        thread.start()
+
+    def _listen(self, engine):
+        while self.listening:
+            conn = None
+            try:
+                raw = engine.raw_connection()
+                raw.detach()
+                conn = raw.connection
+                conn.set_isolation_level(0)
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANGES_CHANNEL}')
+                self._connected_pid = os.getpid()
+                for reset in self._resets:
+                    reset()
+                while self.listening:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    changes = []
+                    while conn.notifies:
+                        cursor, entity, entity_id = conn.notifies.pop(0).payload.split(':')
+                        changes.append((int(cursor), entity, int(entity_id)))
+                    self.publish(changes)
+            except Exception:
+                # reconnected below, after a pause
+                pass
+            finally:
+                self._connected_pid = None
+                # detached from the pool, so nothing else would close it
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(CHANGES_POLL_INTERVAL)
+
+
+notifier = ChangeNotifier()
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_changes(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Change):
+            session.info.setdefault('changes', []).append((obj.id, obj.entity, obj.entity_id))
+
+
+@event.listens_for(db.session, 'after_commit')
+def publish_changes(session):
+    notifier.publish(session.info.pop('changes', None))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_changes(session):
+    session.info.pop('changes', None)
+
+
+def fetch_changes(since, limit=CHANGES_PAGE_SIZE):
+    changes = Change.query.filter(Change.id > since).order_by(Change.id).limit(limit).all()
+    changes = [change.format() for change in changes]
+    # end the read transaction so the pooled connection is not held while
+    # the caller waits for more changes
+    db.session.rollback()
+    return changes
+
+
+def wait_for_changes(app, since, timeout):
+    notifier.start(app)
+    deadline = time.monotonic() + timeout
+    while True:
+        changes = fetch_changes(since)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes
+        # without a working LISTEN connection commits from other workers
+        # are only noticed by polling the log again
+        if not notifier.connected:
+            remaining = min(remaining, CHANGES_POLL_INTERVAL)
+        notifier.wait(since, remaining)
+
+
+def stream_changes(app, since):
+    deadline = time.monotonic() + CHANGES_STREAM_MAX_AGE
+    yield f'retry: {int(CHANGES_POLL_INTERVAL * 1000)}\n\n'
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        changes = wait_for_changes(app, since, min(remaining, CHANGES_KEEPALIVE))
+        if not changes:
+            yield ': keepalive\n\n'
+            continue
+        for change in changes:
+            yield sse_event(change)
+        since = changes[-1]['cursor']
+
+
+def sse_event(change):
+    data = json.dumps(change, separators=(',', ':'))
+    return f'id: {change["cursor"]}\nevent: change\ndata: {data}\n\n'
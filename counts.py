@@ -0,0 +1,93 @@
+import os
+import threading
+from sqlalchemy import select, func
+
+from models import db, Change
+
+
+# "exact" counts rows with COUNT(*); "estimate" reads the planner's row
+# estimate from pg_class on PostgreSQL for tables of at least
+# COUNT_ESTIMATE_MIN rows, and counts exactly below that or elsewhere
+COUNT_MODE = os.environ.get('COUNT_MODE', 'exact')
+COUNT_ESTIMATE_MIN = int(os.environ.get('COUNT_ESTIMATE_MIN', 100000))
+# largest page a client can ask for with ?per_page=
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+
+LATEST_CURSOR = select([func.max(Change.id)])
+ESTIMATE = 'SELECT reltuples FROM pg_class WHERE oid = CAST(:name AS regclass)'
+
+# table name -> (latest change cursor, count, exact)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def exact_count(table):
+    return select([func.count()]).select_from(table)
+
+
+def cached_count(table, cursor):
+    # every write to actors or movies appends to the change log in the same
+    # transaction, so a count is good for as long as the latest cursor is
+    with _cache_lock:
+        entry = _cache.get(table.name)
+        if entry is not None and entry[0] == cursor:
+            return entry[1], entry[2]
+    return None
+
+
+def store_count(table, cursor, count, exact):
+    with _cache_lock:
+        _cache[table.name] = (cursor, count, exact)
+    return count, exact
+
+
+def usable_estimate(estimate):
+    # reltuples is -1 (or 0 on older servers) until the table is analyzed
+    return estimate is not None and estimate >= COUNT_ESTIMATE_MIN
+
+
+# returns (count, exact) for a table, cached until the next write
+def total_count(table, mode=COUNT_MODE):
+    cursor = db.session.execute(LATEST_CURSOR).scalar() or 0
+    cached = cached_count(table, cursor)
+    if cached is not None:
+        return cached
+
+    if mode == 'estimate' and db.session.get_bind().dialect.name == 'postgresql':
+        estimate = db.session.execute(ESTIMATE, {'name': f'"{table.name}"'}).scalar()
+        if usable_estimate(estimate):
+            return store_count(table, cursor, int(estimate), False)
+    return store_count(table, cursor, db.session.execute(exact_count(table)).scalar(), True)
+
+
+# the same for the ASGI entry point, through a `databases` connection
+async def total_count_async(database, table, mode=COUNT_MODE):
+    cursor = await database.fetch_val(LATEST_CURSOR) or 0
+    cached = cached_count(table, cursor)
+    if cached is not None:
+        return cached
+
+    if mode == 'estimate' and database.url.dialect == 'postgresql':
+        estimate = await database.fetch_val(ESTIMATE, {'name': f'"{table.name}"'})
+        if usable_estimate(estimate):
+            return store_count(table, cursor, int(estimate), False)
+    return store_count(table, cursor, await database.fetch_val(exact_count(table)), True)
+
+
+# reads ?page= and ?per_page= into (limit, offset); (None, None) when the
+# client asked for neither. Raises ValueError for values out of range.
+def page_bounds(args):
+    if 'page' not in args and 'per_page' not in args:
+        return None, None
+    page = int(args.get('page', 1))
+    per_page = int(args.get('per_page', 20))
+    if page < 1 or not 1 <= per_page <= MAX_PAGE_SIZE:
+        raise ValueError('page out of range')
+    return per_page, (page - 1) * per_page
+
+
+def count_headers(count, exact):
+    headers = {'X-Total-Count': str(count)}
+    if not exact:
+        headers['X-Total-Count-Estimated'] = 'true'
+    return headers
@@ -0,0 +1,297 @@
+import os
+import threading
+from array import array
+
+from models import db, helper_table, Change
+from changes import fetch_changes, CHANGES_PAGE_SIZE
+
+
+GRAPH_MAX_HOPS = int(os.environ.get('GRAPH_MAX_HOPS', 6))
+# pending edge edits are folded back into the arrays once they outnumber
+# this share of the indexed edges
+GRAPH_COMPACT_RATIO = float(os.environ.get('GRAPH_COMPACT_RATIO', 0.1))
+GRAPH_COMPACT_MIN = int(os.environ.get('GRAPH_COMPACT_MIN', 10000))
+
+
+def _csr(size, sources, targets):
+    offsets = array('l', [0]) * (size + 1)
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+
+    adjacency = array('l', [0]) * len(sources)
+    fill = array('l', offsets)
+    for source, target in zip(sources, targets):
+        adjacency[fill[source]] = target
+        fill[source] += 1
+    return offsets, adjacency
+
+
+'''
+CastGraph
+The actor <-> movie cast links held as two CSR (compressed sparse row)
+arrays: the movies of actor i are actor_movies[actor_offsets[i]:actor_offsets[i + 1]]
+and likewise for the actors of a movie. Ids are mapped to dense indexes.
+Cast changes made after the arrays were built are kept in small add/remove
+overlays until there are enough of them to be worth a compaction.
+'''
+class CastGraph:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.cursor = None
+        self.load([], [], None)
+
+    def load(self, actor_ids, movie_ids, cursor):
+        self.actor_index = {}
+        self.actor_ids = array('l')
+        self.movie_index = {}
+        self.movie_ids = array('l')
+
+        sources = array('l', (self._actor(actor_id) for actor_id in actor_ids))
+        targets = array('l', (self._movie(movie_id) for movie_id in movie_ids))
+        self.base_actors = len(self.actor_ids)
+        self.base_movies = len(self.movie_ids)
+        self.actor_offsets, self.actor_movies = _csr(self.base_actors, sources, targets)
+        self.movie_offsets, self.movie_actors = _csr(self.base_movies, targets, sources)
+
+        self.added_movies = {}
+        self.added_actors = {}
+        self.removed = set()
+        self.dead_actors = set()
+        self.dead_movies = set()
+        self.edges = len(sources)
+        self.cursor = cursor
+
+    def _actor(self, actor_id):
+        index = self.actor_index.get(actor_id)
+        if index is None:
+            index = self.actor_index[actor_id] = len(self.actor_ids)
+            self.actor_ids.append(actor_id)
+        return index
+
+    def _movie(self, movie_id):
+        index = self.movie_index.get(movie_id)
+        if index is None:
+            index = self.movie_index[movie_id] = len(self.movie_ids)
+            self.movie_ids.append(movie_id)
+        return index
+
+    def _base_movies_of(self, actor):
+        if actor >= self.base_actors:
+            return ()
+        return self.actor_movies[self.actor_offsets[actor]:self.actor_offsets[actor + 1]]
+
+    def _base_actors_of(self, movie):
+        if movie >= self.base_movies:
+            return ()
+        return self.movie_actors[self.movie_offsets[movie]:self.movie_offsets[movie + 1]]
+
+    def movies_of(self, actor):
+        if actor in self.dead_actors:
+            return []
+        movies = [movie for movie in self._base_movies_of(actor)
+                  if movie not in self.dead_movies and (actor, movie) not in self.removed]
+        movies.extend(movie for movie in self.added_movies.get(actor, ())
+                      if movie not in self.dead_movies)
+        return movies
+
+    def actors_of(self, movie):
+        if movie in self.dead_movies:
+            return []
+        actors = [actor for actor in self._base_actors_of(movie)
+                  if actor not in self.dead_actors and (actor, movie) not in self.removed]
+        actors.extend(actor for actor in self.added_actors.get(movie, ())
+                      if actor not in self.dead_actors)
+        return actors
+
+    ## incremental updates
+
+    def add_edge(self, actor_id, movie_id):
+        actor, movie = self._actor(actor_id), self._movie(movie_id)
+        if (actor, movie) in self.removed:
+            self.removed.discard((actor, movie))
+            self.edges += 1
+        elif movie not in self._base_movies_of(actor) and movie not in self.added_movies.get(actor, ()):
+            self.added_movies.setdefault(actor, set()).add(movie)
+            self.added_actors.setdefault(movie, set()).add(actor)
+            self.edges += 1
+
+    def remove_edge(self, actor_id, movie_id):
+        actor, movie = self.actor_index.get(actor_id), self.movie_index.get(movie_id)
+        if actor is None or movie is None:
+            return
+        if movie in self.added_movies.get(actor, ()):
+            self.added_movies[actor].discard(movie)
+            self.added_actors[movie].discard(actor)
+            self.edges -= 1
+        elif movie in self._base_movies_of(actor) and (actor, movie) not in self.removed:
+            self.removed.add((actor, movie))
+            self.edges -= 1
+
+    # a reused id starts without links; its old links went with the delete,
+    # which cascades in the database without logging them one by one
+    def revive_actor(self, actor_id):
+        actor = self.actor_index.get(actor_id)
+        if actor is None or actor not in self.dead_actors:
+            return
+        self.dead_actors.discard(actor)
+        for movie in self._base_movies_of(actor):
+            if (actor, movie) not in self.removed:
+                self.removed.add((actor, movie))
+                self.edges -= 1
+        for movie in self.added_movies.pop(actor, ()):
+            self.added_actors[movie].discard(actor)
+            self.edges -= 1
+
+    def revive_movie(self, movie_id):
+        movie = self.movie_index.get(movie_id)
+        if movie is None or movie not in self.dead_movies:
+            return
+        self.dead_movies.discard(movie)
+        for actor in self._base_actors_of(movie):
+            if (actor, movie) not in self.removed:
+                self.removed.add((actor, movie))
+                self.edges -= 1
+        for actor in self.added_actors.pop(movie, ()):
+            self.added_movies[actor].discard(movie)
+            self.edges -= 1
+
+    def apply(self, change):
+        entity, op = change['entity'], change['op']
+        if entity == 'cast' and op == 'insert':
+            self.add_edge(change['data']['actor_id'], change['data']['movie_id'])
+        elif entity == 'cast' and op == 'delete':
+            self.remove_edge(change['data']['actor_id'], change['data']['movie_id'])
+        elif entity == 'actor' and op == 'delete' and change['id'] in self.actor_index:
+            self.dead_actors.add(self.actor_index[change['id']])
+        elif entity == 'movie' and op == 'delete' and change['id'] in self.movie_index:
+            self.dead_movies.add(self.movie_index[change['id']])
+        elif entity == 'actor' and op == 'insert':
+            self.revive_actor(change['id'])
+        elif entity == 'movie' and op == 'insert':
+            self.revive_movie(change['id'])
+        self.cursor = change['cursor']
+
+    def pending(self):
+        return (len(self.removed) + len(self.dead_actors) + len(self.dead_movies)
+                + sum(len(movies) for movies in self.added_movies.values()))
+
+    def compact(self):
+        actor_ids, movie_ids = array('l'), array('l')
+        for actor in range(len(self.actor_ids)):
+            for movie in self.movies_of(actor):
+                actor_ids.append(self.actor_ids[actor])
+                movie_ids.append(self.movie_ids[movie])
+        self.load(actor_ids, movie_ids, self.cursor)
+
+    ## queries
+
+    def costars(self, actor_id, hops):
+        start = self.actor_index.get(actor_id)
+        if start is None or start in self.dead_actors:
+            return {}
+
+        distances = {start: 0}
+        seen_movies = set()
+        frontier = [start]
+        for depth in range(1, hops + 1):
+            next_frontier = []
+            for actor in frontier:
+                for movie in self.movies_of(actor):
+                    if movie in seen_movies:
+                        continue
+                    seen_movies.add(movie)
+                    for costar in self.actors_of(movie):
+                        if costar not in distances:
+                            distances[costar] = depth
+                            next_frontier.append(costar)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+
+        del distances[start]
+        return {self.actor_ids[actor]: depth for actor, depth in distances.items()}
+
+    def shortest_path(self, source_id, target_id, max_hops=GRAPH_MAX_HOPS):
+        source = self.actor_index.get(source_id)
+        target = self.actor_index.get(target_id)
+        if source is None or target is None or source in self.dead_actors or target in self.dead_actors:
+            return None
+        if source == target:
+            return [source_id]
+
+        # bidirectional BFS over actors, always growing the smaller side;
+        # parents map an actor to the (actor, movie) it was reached through
+        parents = ({source: None}, {target: None})
+        frontiers = ([source], [target])
+        seen_movies = (set(), set())
+        for _ in range(max_hops):
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            next_frontier = []
+            for actor in frontiers[side]:
+                for movie in self.movies_of(actor):
+                    if movie in seen_movies[side]:
+                        continue
+                    seen_movies[side].add(movie)
+                    for costar in self.actors_of(movie):
+                        if costar in parents[side]:
+                            continue
+                        parents[side][costar] = (actor, movie)
+                        if costar in parents[1 - side]:
+                            return self._path(parents, costar)
+                        next_frontier.append(costar)
+            if not next_frontier:
+                return None
+            frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+        return None
+
+    def _path(self, parents, meeting):
+        forward = []
+        actor = meeting
+        while parents[0][actor] is not None:
+            previous, movie = parents[0][actor]
+            forward.append((self.movie_ids[movie], self.actor_ids[actor]))
+            actor = previous
+        path = [self.actor_ids[actor]]
+        for movie_id, actor_id in reversed(forward):
+            path.extend((movie_id, actor_id))
+
+        actor = meeting
+        while parents[1][actor] is not None:
+            following, movie = parents[1][actor]
+            path.extend((self.movie_ids[movie], self.actor_ids[following]))
+            actor = following
+        return path
+
+    ## database sync
+
+    def build(self):
+        # the cursor is read before the links; changes committed in between
+        # are replayed on the next sync, which is harmless since edge edits
+        # are idempotent
+        cursor = db.session.query(db.func.max(Change.id)).scalar() or 0
+        actor_ids, movie_ids = array('l'), array('l')
+        rows = db.session.query(helper_table.c.actor_id, helper_table.c.movie_id).yield_per(10000)
+        for actor_id, movie_id in rows:
+            actor_ids.append(actor_id)
+            movie_ids.append(movie_id)
+        db.session.rollback()
+        self.load(actor_ids, movie_ids, cursor)
+
+    def sync(self):
+        with self.lock:
+            if self.cursor is None:
+                self.build()
+                return
+            while True:
+                changes = fetch_changes(self.cursor)
+                for change in changes:
+                    self.apply(change)
+                if len(changes) < CHANGES_PAGE_SIZE:
+                    break
+            if self.pending() > max(GRAPH_COMPACT_MIN, self.edges * GRAPH_COMPACT_RATIO):
+                self.compact()
+
+
+cast_graph = CastGraph()
@@ -0,0 +1,23 @@
+import gc
+import multiprocessing
+import os
+
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# threaded workers let concurrent identical reads share one query
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# load the app once in the master so workers share its memory pages
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from app import app, warm_up
+    warm_up(app)
+    # move everything allocated so far out of the cyclic GC's reach; its
+    # collections would otherwise write to every object header and undo
+    # the sharing after the fork
+    gc.freeze()
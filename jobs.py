@@ -0,0 +1,316 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import json
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, helper_table, Actor, Movie, Job
+from scheduling import parse_date
+from stats import rebuild_stats
+
+
+JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 1))
+# seconds without a heartbeat after which a running job is handed to
+# another worker
+JOBS_LEASE = float(os.environ.get('JOBS_LEASE', 300))
+JOBS_RETRY_DELAY = float(os.environ.get('JOBS_RETRY_DELAY', 5))
+JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 3))
+JOBS_BATCH_SIZE = int(os.environ.get('JOBS_BATCH_SIZE', 500))
+# comma separated kind=limit pairs capping how many jobs of a kind run at
+# once across every worker
+JOBS_CONCURRENCY = os.environ.get('JOBS_CONCURRENCY', 'export=2,import=1,stats_rebuild=1')
+# advisory lock serializing job claims on PostgreSQL
+JOBS_LOCK_KEY = 2034
+
+logger = logging.getLogger(__name__)
+
+
+def load_limits():
+    limits = {}
+    for entry in filter(None, JOBS_CONCURRENCY.split(',')):
+        kind, limit = entry.strip().split('=')
+        limits[kind] = int(limit)
+    return limits
+
+
+## JobError Exception
+'''
+JobError Exception
+Raised by a handler for a failure that retrying will not fix.
+'''
+class JobError(Exception):
+    pass
+
+
+'''
+JobContext
+Handed to job handlers so they can report progress, which also renews the
+job's lease.
+'''
+class JobContext:
+    def __init__(self, job_id, worker):
+        self.job_id = job_id
+        self.worker = worker
+
+    def progress(self, fraction):
+        now = datetime.utcnow()
+        Job.query.filter(Job.id == self.job_id, Job.locked_by == self.worker).update({
+            'progress': round(min(max(fraction, 0), 1), 4),
+            'locked_at': now,
+            'updated_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+
+
+## Handlers
+##################################################################
+
+# reads `query` in `keys` order, JOBS_BATCH_SIZE rows per query, so the
+# session can commit between batches
+def keyset_batches(query, keys):
+    batch = query.order_by(*keys).limit(JOBS_BATCH_SIZE).all()
+    while batch:
+        yield batch
+        if len(batch) < JOBS_BATCH_SIZE:
+            return
+        last = tuple(getattr(batch[-1], key.key) for key in keys)
+        after = db.tuple_(*keys) > last if len(keys) > 1 else keys[0] > last[0]
+        batch = query.filter(after).order_by(*keys).limit(JOBS_BATCH_SIZE).all()
+
+
+def cast_row(row):
+    return {
+    'movie_id': row.movie_id,
+    'actor_id': row.actor_id,
+    'start_date': row.start_date.isoformat() if row.start_date else None,
+    'end_date': row.end_date.isoformat() if row.end_date else None
+    }
+
+
+def run_export(context, payload):
+    entities = payload.get('entities', ['actors', 'movies', 'cast'])
+    result = {}
+    sources = {
+        'actors': (Actor.query, (Actor.id,), Actor.serialize),
+        'movies': (Movie.query, (Movie.id,), Movie.serialize),
+        'cast': (db.session.query(helper_table), (helper_table.c.movie_id, helper_table.c.actor_id), cast_row),
+    }
+    unknown = set(entities) - set(sources)
+    if unknown:
+        raise JobError(f'unknown entities: {", ".join(sorted(unknown))}')
+
+    for done, entity in enumerate(entities):
+        query, keys, serialize = sources[entity]
+        rows = result[entity] = []
+        for batch in keyset_batches(query, keys):
+            rows.extend(serialize(row) for row in batch)
+            # renews the lease while a large table is read
+            context.progress(done / len(entities))
+        context.progress((done + 1) / len(entities))
+    return result
+
+
+def run_import(context, payload):
+    actors = payload.get('actors', [])
+    movies = payload.get('movies', [])
+    if not (isinstance(actors, list) and isinstance(movies, list)):
+        raise JobError('actors and movies must be lists')
+    total = len(actors) + len(movies) or 1
+    created = {'actors': 0, 'movies': 0}
+    errors = []
+
+    def load(rows, model, key, build, label):
+        for start in range(0, len(rows), JOBS_BATCH_SIZE):
+            batch = rows[start:start + JOBS_BATCH_SIZE]
+            # anything but a string would break the whole batch's lookup;
+            # such rows are reported below
+            names = [row.get(key) for row in batch
+                     if isinstance(row, dict) and isinstance(row.get(key), str)]
+            existing = {value for value, in db.session.query(getattr(model, key)).filter(
+                getattr(model, key).in_(names))}
+            for position, row in enumerate(batch, start):
+                try:
+                    if not isinstance(row, dict):
+                        raise ValueError('row must be an object')
+                    if not isinstance(row[key], str):
+                        raise ValueError(f'{key} must be a string')
+                    if row[key] in existing:
+                        raise ValueError(f'{key} already exists')
+                    entity = build(row)
+                    # a row the database rejects (too long, constraint)
+                    # rolls back to here instead of taking the batch along
+                    with db.session.begin_nested():
+                        entity.insert(commit=False)
+                    existing.add(row[key])
+                    created[label] += 1
+                except KeyError as error:
+                    errors.append({'entity': label, 'index': position, 'error': f'missing {error.args[0]}'})
+                except (TypeError, ValueError) as error:
+                    errors.append({'entity': label, 'index': position, 'error': str(error)})
+                except SQLAlchemyError as error:
+                    errors.append({'entity': label, 'index': position,
+                                   'error': str(getattr(error, 'orig', None) or error).strip()})
+            db.session.commit()
+            context.progress((created['actors'] + created['movies'] + len(errors)) / total)
+
+    def build_actor(row):
+        if not (row['name'] and row['age'] and row['gender'] in ('m', 'f')):
+            raise ValueError('name, age and gender (m/f) are required')
+        return Actor(name=row['name'], age=int(row['age']), gender=row['gender'])
+
+    def build_movie(row):
+        if not row['title']:
+            raise ValueError('title is required')
+        if not isinstance(row['release_date'], str):
+            raise ValueError('release_date must be a YYYY-MM-DD string')
+        return Movie(title=row['title'], release_date=parse_date(row['release_date']))
+
+    load(actors, Actor, 'name', build_actor, 'actors')
+    load(movies, Movie, 'title', build_movie, 'movies')
+    return {'created': created, 'errors': errors}
+
+
+def run_stats_rebuild(context, payload):
+    rebuild_stats()
+    return {'rebuilt': True}
+
+
+HANDLERS = {
+    'export': run_export,
+    'import': run_import,
+    'stats_rebuild': run_stats_rebuild,
+}
+
+
+## Queue
+##################################################################
+
+def enqueue(kind, payload=None, max_attempts=JOBS_MAX_ATTEMPTS):
+    if kind not in HANDLERS:
+        raise JobError(f'unknown job kind: {kind}')
+    job = Job(kind=kind, payload=json.dumps(payload or {}), max_attempts=max_attempts)
+    job.insert()
+    return job
+
+
+def requeue_expired(now):
+    # jobs whose worker stopped sending heartbeats go back to the queue, or
+    # fail once they have used up their attempts
+    expired = Job.status == 'running'
+    expired = expired & (Job.locked_at < now - timedelta(seconds=JOBS_LEASE))
+    Job.query.filter(expired, Job.attempts < Job.max_attempts).update(
+        {'status': 'queued', 'locked_by': None, 'run_after': now, 'updated_at': now},
+        synchronize_session=False)
+    Job.query.filter(expired, Job.attempts >= Job.max_attempts).update(
+        {'status': 'failed', 'error': 'worker lease expired', 'locked_by': None, 'updated_at': now},
+        synchronize_session=False)
+
+
+def claim(worker, limits):
+    now = datetime.utcnow()
+    postgres = db.session.get_bind().dialect.name == 'postgresql'
+    if postgres:
+        db.session.execute('SELECT pg_advisory_xact_lock(:key)', {'key': JOBS_LOCK_KEY})
+    requeue_expired(now)
+
+    running = dict(db.session.query(Job.kind, db.func.count()).filter(
+        Job.status == 'running').group_by(Job.kind))
+    kinds = [kind for kind in HANDLERS if running.get(kind, 0) < limits.get(kind, 1)]
+    if not kinds:
+        db.session.commit()
+        return None
+
+    candidates = Job.query.filter(Job.status == 'queued', Job.run_after <= now,
+                                  Job.kind.in_(kinds)).order_by(Job.id)
+    if postgres:
+        candidates = candidates.with_for_update(skip_locked=True)
+    for job in candidates.limit(10):
+        claimed = Job.query.filter(Job.id == job.id, Job.status == 'queued').update({
+            'status': 'running',
+            'locked_by': worker,
+            'locked_at': now,
+            'attempts': Job.attempts + 1,
+            'updated_at': now
+        }, synchronize_session=False)
+        if claimed:
+            db.session.commit()
+            return job.id
+    db.session.commit()
+    return None
+
+
+def execute(job_id, worker):
+    job = Job.query.get(job_id)
+    if job is None:
+        db.session.commit()
+        return
+    kind, payload = job.kind, job.payload
+    attempts, max_attempts = job.attempts, job.max_attempts
+    db.session.commit()
+
+    try:
+        # a kind can be dropped from HANDLERS while its jobs are queued
+        if kind not in HANDLERS:
+            raise JobError(f'unknown job kind: {kind}')
+        payload = json.loads(payload) if payload else {}
+        result = HANDLERS[kind](JobContext(job_id, worker), payload)
+        update = {'status': 'succeeded', 'progress': 1, 'result': json.dumps(result), 'error': None}
+    except Exception as error:
+        db.session.rollback()
+        retry = attempts < max_attempts and not isinstance(error, JobError)
+        update = {'status': 'queued' if retry else 'failed', 'error': f'{type(error).__name__}: {error}'}
+        if retry:
+            update['run_after'] = datetime.utcnow() + timedelta(seconds=JOBS_RETRY_DELAY * 2 ** (attempts - 1))
+        logger.exception('job %s failed', job_id)
+
+    update.update(locked_by=None, updated_at=datetime.utcnow())
+    Job.query.filter(Job.id == job_id, Job.locked_by == worker).update(update, synchronize_session=False)
+    db.session.commit()
+
+
+'''
+Worker
+Polls the Job table from `threads` threads, each running one job at a time.
+Started with `python manage.py jobs_worker`; any number of worker processes
+can run against the same database.
+'''
+def run_worker(app, threads=2, stop=None):
+    stop = stop or threading.Event()
+    limits = load_limits()
+    host = socket.gethostname()
+
+    def loop(number):
+        worker = f'{host}:{os.getpid()}:{number}'
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    job_id = claim(worker, limits)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('could not claim a job')
+                    job_id = None
+                if job_id is None:
+                    stop.wait(JOBS_POLL_INTERVAL)
+                    continue
+                try:
+                    execute(job_id, worker)
+                except Exception:
+                    # the job keeps its lock until the lease runs out and
+                    # another worker picks it up
+                    db.session.rollback()
+                    logger.exception('could not run job %s', job_id)
+                db.session.remove()
+
+    pool = [threading.Thread(target=loop, args=(number,), daemon=True) for number in range(threads)]
+    for thread in pool:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in pool):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+    for thread in pool:
+        thread.join()
@@ -3,6 +3,8 @@ from flask_migrate import Migrate, MigrateCommand
 
 from app import app
 from models import db
+from stats import rebuild_stats as rebuild_stat_tables
+from jobs import run_worker
 
 migrate = Migrate(app, db)
 manager = Manager(app)
@@ -10,5 +12,18 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+@manager.command
+def rebuild_stats():
+    "Recompute the catalogue statistics from scratch"
+    rebuild_stat_tables()
+
+
+@manager.option('-t', '--threads', dest='threads', type=int, default=2,
+                help='number of jobs to run at once')
+def jobs_worker(threads):
+    "Run queued background jobs until interrupted"
+    run_worker(app, threads)
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,32 @@
+"""change log
+
+Revision ID: 4c2e7f1a9d3b
+Revises: 98b9e20f420c
+Create Date: 2026-10-19 09:12:40.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c2e7f1a9d3b'
+down_revision = '98b9e20f420c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Change',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=16), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=8), nullable=False),
+    sa.Column('data', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('Change')
@@ -0,0 +1,38 @@
+"""cast shooting windows
+
+Revision ID: 7a5d0b3e81c6
+Revises: 4c2e7f1a9d3b
+Create Date: 2026-10-19 11:03:18.715224
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a5d0b3e81c6'
+down_revision = '4c2e7f1a9d3b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('helper', sa.Column('start_date', sa.Date(), nullable=True))
+    op.add_column('helper', sa.Column('end_date', sa.Date(), nullable=True))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # the GiST exclusion constraint doubles as the range index used by
+        # availability lookups and rejects overlapping bookings of an actor
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        op.execute(
+            'ALTER TABLE helper ADD CONSTRAINT helper_actor_window_excl '
+            "EXCLUDE USING gist (actor_id WITH =, daterange(start_date, end_date, '[]') WITH &&) "
+            'WHERE (start_date IS NOT NULL AND end_date IS NOT NULL)'
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE helper DROP CONSTRAINT helper_actor_window_excl')
+    op.drop_column('helper', 'end_date')
+    op.drop_column('helper', 'start_date')
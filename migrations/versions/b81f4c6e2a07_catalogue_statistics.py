@@ -0,0 +1,30 @@
+"""catalogue statistics
+
+Revision ID: b81f4c6e2a07
+Revises: 7a5d0b3e81c6
+Create Date: 2026-10-19 12:20:51.330918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f4c6e2a07'
+down_revision = '7a5d0b3e81c6'
+branch_labels = None
+depends_on = None
+
+
+# fill the new table with `python manage.py rebuild_stats` after upgrading
+def upgrade():
+    op.create_table('Stat',
+    sa.Column('name', sa.String(length=32), nullable=False),
+    sa.Column('bucket', sa.String(length=32), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name', 'bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('Stat')
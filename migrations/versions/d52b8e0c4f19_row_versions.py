@@ -0,0 +1,26 @@
+"""row versions
+
+Revision ID: d52b8e0c4f19
+Revises: c3f9a1d75e28
+Create Date: 2026-10-19 13:41:27.118503
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd52b8e0c4f19'
+down_revision = 'c3f9a1d75e28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Actor', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Movie', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Movie', 'version')
+    op.drop_column('Actor', 'version')
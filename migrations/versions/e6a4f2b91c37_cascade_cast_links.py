@@ -0,0 +1,35 @@
+"""cascade cast links
+
+Revision ID: e6a4f2b91c37
+Revises: d52b8e0c4f19
+Create Date: 2026-10-19 14:22:40.903516
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a4f2b91c37'
+down_revision = 'd52b8e0c4f19'
+branch_labels = None
+depends_on = None
+
+
+# SQLite cannot alter foreign keys in place; databases created there with
+# db.create_all get the cascades from the model
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_constraint('helper_movie_id_fkey', 'helper', type_='foreignkey')
+    op.drop_constraint('helper_actor_id_fkey', 'helper', type_='foreignkey')
+    op.create_foreign_key('helper_movie_id_fkey', 'helper', 'Movie', ['movie_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('helper_actor_id_fkey', 'helper', 'Actor', ['actor_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_constraint('helper_actor_id_fkey', 'helper', type_='foreignkey')
+    op.drop_constraint('helper_movie_id_fkey', 'helper', type_='foreignkey')
+    op.create_foreign_key('helper_actor_id_fkey', 'helper', 'Actor', ['actor_id'], ['id'])
+    op.create_foreign_key('helper_movie_id_fkey', 'helper', 'Movie', ['movie_id'], ['id'])
@@ -1,5 +1,8 @@
 import os
-from sqlalchemy import Column, String, Integer
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, select, case, event
+from sqlalchemy.engine import Engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -9,6 +12,12 @@ database_path = f"postgresql://omar@:5432/{database_name}"
 '''
 database_url = os.environ.get('DATABASE_URL')
 
+# channel used with LISTEN/NOTIFY to announce new change log entries
+CHANGES_CHANNEL = 'changes'
+# advisory lock taken by change log writers on PostgreSQL so that cursors
+# become visible to readers in the order they were assigned
+CHANGES_LOCK_KEY = 2026
+
 db = SQLAlchemy()
 def setup_db(app, database_path=database_url):
 
@@ -18,62 +27,474 @@ def setup_db(app, database_path=database_url):
     db.init_app(app)
 
 
+# SQLite only enforces foreign keys, and so the cast link cascades, when
+# asked to on each connection
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if type(dbapi_connection).__module__.startswith('sqlite3'):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
 
 
 
 helper_table = db.Table('helper',
-    db.Column('movie_id', db.Integer, db.ForeignKey('Movie.id'), primary_key=True),
-    db.Column('actor_id', db.Integer, db.ForeignKey('Actor.id'), primary_key=True)
+    # deleting an actor or a movie drops its cast links in the database
+    db.Column('movie_id', db.Integer, db.ForeignKey('Movie.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('actor_id', db.Integer, db.ForeignKey('Actor.id', ondelete='CASCADE'), primary_key=True),
+    # shooting window of the casting; both ends are inclusive
+    db.Column('start_date', db.Date(), nullable=True),
+    db.Column('end_date', db.Date(), nullable=True)
 )
 
 
+'''
+Change log
+An append-only record of every write to actors, movies and cast links.
+Entries are added in the same transaction as the write they describe, so
+the log never shows a change that was rolled back. Deleting an actor or a
+movie also drops its cast links; no separate 'cast' entries are written
+for those.
+'''
+class Change(db.Model):
+    __tablename__ = 'Change'
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(8), nullable=False)
+    data = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def format(self):
+        return {
+        'cursor': self.id,
+        'entity': self.entity,
+        'id': self.entity_id,
+        'op': self.op,
+        'data': json.loads(self.data) if self.data else None,
+        'at': self.created_at.isoformat() + 'Z'
+        }
+
+
+def record_change(entity, entity_id, op, data=None):
+    postgres = db.session.get_bind().dialect.name == 'postgresql'
+    if postgres:
+        db.session.execute('SELECT pg_advisory_xact_lock(:key)', {'key': CHANGES_LOCK_KEY})
+
+    change = Change(entity=entity, entity_id=entity_id, op=op,
+                    data=json.dumps(data) if data is not None else None)
+    db.session.add(change)
+    db.session.flush()
+
+    if postgres:
+        # delivered by PostgreSQL only once the transaction commits
+        db.session.execute('SELECT pg_notify(:channel, :payload)', {
+            'channel': CHANGES_CHANNEL,
+            'payload': f'{change.id}:{entity}:{entity_id}'
+        })
+    return change
+
+
+# one change log entry per id, written by a single INSERT on PostgreSQL
+def record_changes(entity, op, entity_ids):
+    if not entity_ids:
+        return
+    params = {'entity': entity, 'op': op, 'at': datetime.utcnow()}
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute('SELECT pg_advisory_xact_lock(:key)', {'key': CHANGES_LOCK_KEY})
+        rows = db.session.execute(
+            'INSERT INTO "Change" (entity, entity_id, op, created_at) '
+            'SELECT :entity, entity_id, :op, :at FROM unnest(CAST(:ids AS integer[])) AS entity_id '
+            'RETURNING id, entity, entity_id', dict(params, ids=list(entity_ids))).fetchall()
+        db.session.execute(
+            'SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload', {
+            'channel': CHANGES_CHANNEL,
+            'payloads': [f'{cursor}:{entity}:{entity_id}' for cursor, entity, entity_id in rows]
+        })
+    else:
+        rows = []
+        for entity_id in entity_ids:
+            result = db.session.execute(Change.__table__.insert().values(entity_id=entity_id, **{
+                'entity': entity, 'op': op, 'created_at': params['at']}))
+            rows.append((result.inserted_primary_key[0], entity, entity_id))
+    # published to this process on commit, as changes.collect_changes does
+    # for entries added through the ORM
+    db.session.info.setdefault('changes', []).extend(tuple(row) for row in rows)
+
+
+'''
+Catalogue statistics
+Counters kept in the Stat table and adjusted in the same transaction as the
+writes that change them, so reading every statistic is a single small scan.
+'''
+class Stat(db.Model):
+    __tablename__ = 'Stat'
+    name = db.Column(db.String(32), primary_key=True)
+    bucket = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+AGE_BANDS = ((0, 17), (18, 29), (30, 44), (45, 64), (65, None))
+
+
+def age_band(age):
+    for low, high in AGE_BANDS:
+        if high is None or age <= high:
+            return f'{low}+' if high is None else f'{low}-{high}'
+
+
+def bump_stat(name, bucket, delta):
+    if not delta:
+        return
+    params = {'name': name, 'bucket': str(bucket), 'delta': delta}
+    if db.session.get_bind().dialect.name in ('postgresql', 'sqlite'):
+        db.session.execute(
+            'INSERT INTO "Stat" (name, bucket, value) VALUES (:name, :bucket, :delta) '
+            'ON CONFLICT (name, bucket) DO UPDATE SET value = "Stat".value + excluded.value',
+            params)
+        return
+    updated = db.session.execute(
+        'UPDATE "Stat" SET value = value + :delta WHERE name = :name AND bucket = :bucket', params)
+    if not updated.rowcount:
+        db.session.execute('INSERT INTO "Stat" (name, bucket, value) VALUES (:name, :bucket, :delta)', params)
+
+
+def cast_sizes(movie_ids):
+    if not movie_ids:
+        return {}
+    rows = db.session.query(helper_table.c.movie_id, db.func.count()).filter(
+        helper_table.c.movie_id.in_(movie_ids)).group_by(helper_table.c.movie_id)
+    sizes = dict.fromkeys(movie_ids, 0)
+    sizes.update(rows)
+    return sizes
+
+
+def track_actor(gender, age, sign):
+    bump_stat('actors_by_gender', gender, sign)
+    bump_stat('actors_by_age_band', age_band(age), sign)
+    bump_stat('totals', 'actors', sign)
+
+
+def track_movie(release_date, cast_size, sign):
+    bump_stat('movies_per_year', release_date.year, sign)
+    bump_stat('cast_size', cast_size, sign)
+    bump_stat('totals', 'movies', sign)
+    bump_stat('totals', 'castings', sign * cast_size)
+
+
+def track_cast(sizes, delta):
+    # moves each movie from its current cast size bucket to the new one
+    for size in sizes.values():
+        bump_stat('cast_size', size, -1)
+        bump_stat('cast_size', size + delta, 1)
+    bump_stat('totals', 'castings', delta * len(sizes))
+
+
+# Applies `values` to one row and bumps its version. On PostgreSQL this is a
+# single UPDATE ... FROM joined to the row's previous state and RETURNING
+# both; the change log lock is taken first, as by every other writer, so
+# the previous state cannot move underneath it. Elsewhere the row is read
+# and then updated only if its version has not changed since. Returns
+# (new, old) dicts, or None when the row does not exist or its version is
+# not one of `versions`.
+def versioned_update(model, entity_id, values, versions=None):
+    table = model.__table__
+    if not values:
+        # nothing to write: the row as it is, keeping its version
+        current = db.session.execute(select([table]).where(table.c.id == entity_id)).first()
+        if current is None or (versions is not None and current['version'] not in versions):
+            return None
+        return dict(current), dict(current)
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute('SELECT pg_advisory_xact_lock(:key)', {'key': CHANGES_LOCK_KEY})
+        old = table.alias('old')
+        statement = table.update().where(table.c.id == entity_id).where(old.c.id == table.c.id)
+        if versions is not None:
+            statement = statement.where(table.c.version.in_(versions))
+        statement = statement.values(version=table.c.version + 1, **values).returning(
+            *(list(table.c) + [column.label('old_' + column.name) for column in old.c]))
+        row = db.session.execute(statement).first()
+        if row is None:
+            return None
+        return ({column.name: row[column.name] for column in table.c},
+                {column.name: row['old_' + column.name] for column in table.c})
+
+    while True:
+        current = db.session.execute(select([table]).where(table.c.id == entity_id)).first()
+        if current is None or (versions is not None and current['version'] not in versions):
+            return None
+        updated = db.session.execute(table.update().where(
+            (table.c.id == entity_id) & (table.c.version == current['version'])
+        ).values(version=table.c.version + 1, **values))
+        if updated.rowcount:
+            old = dict(current)
+            return dict(old, version=old['version'] + 1, **values), old
+
+
+def bump_stats(counters):
+    for (name, bucket), delta in counters.items():
+        bump_stat(name, bucket, delta)
+
+
+# Deletes every row of `model` matching `condition` in one DELETE and
+# returns the deleted rows, each as a tuple of `columns`. Rows are read
+# first where DELETE ... RETURNING is not available. The change log lock is
+# held throughout on PostgreSQL, so `before` sees the same rows the DELETE
+# removes; it is called with the id subquery ahead of the DELETE.
+def delete_rows(model, condition, columns, before=None):
+    table = model.__table__
+    columns = [table.c[name] for name in columns]
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute('SELECT pg_advisory_xact_lock(:key)', {'key': CHANGES_LOCK_KEY})
+        targets = select([table.c.id]).where(condition)
+        if before:
+            before(targets)
+        return db.session.execute(table.delete().where(condition).returning(*columns)).fetchall()
+
+    rows = db.session.execute(select(columns).where(condition)).fetchall()
+    ids = [row[0] for row in rows]
+    if ids:
+        if before:
+            before(ids)
+        db.session.execute(table.delete().where(table.c.id.in_(ids)))
+    return rows
+
+
+def cast_data(movie_id, actor_id, start_date=None, end_date=None):
+    return {
+    'movie_id': movie_id,
+    'actor_id': actor_id,
+    'start_date': start_date.isoformat() if start_date else None,
+    'end_date': end_date.isoformat() if end_date else None
+    }
+
+
 class Actor(db.Model):
     __tablename__ = 'Actor'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True , nullable=False)
     age = db.Column(db.Integer, nullable=False)
     gender = db.Column(db.Enum('m','f', name='gender_types'), nullable=False)
+    # bumped by every update and sent as the ETag
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
-    def insert(self):
+    def insert(self, commit=True):
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
+        record_change('actor', self.id, 'insert', self.serialize())
+        track_actor(self.gender, self.age, 1)
+        if commit:
+            db.session.commit()
 
     def delete(self):
-        db.session.delete(self)
+        db.session.expunge(self)
+        Actor.delete_where(Actor.id == self.id)
+
+    # deletes all matching actors, and through the foreign key cascade their
+    # cast links, with one DELETE; returns the deleted ids
+    @classmethod
+    def delete_where(cls, condition):
+        counters = Counter()
+
+        def count_links(targets):
+            # cast sizes of the movies the deleted actors appear in
+            removed = db.func.sum(case([(helper_table.c.actor_id.in_(targets), 1)], else_=0))
+            sizes = db.session.query(helper_table.c.movie_id, db.func.count(), removed).filter(
+                helper_table.c.movie_id.in_(
+                    select([helper_table.c.movie_id]).where(helper_table.c.actor_id.in_(targets)))
+            ).group_by(helper_table.c.movie_id)
+            for movie_id, size, lost in sizes:
+                counters['cast_size', str(size)] -= 1
+                counters['cast_size', str(size - lost)] += 1
+                counters['totals', 'castings'] -= lost
+
+        rows = delete_rows(cls, condition, ('id', 'gender', 'age'), count_links)
+        for actor_id, gender, age in rows:
+            counters['actors_by_gender', gender] -= 1
+            counters['actors_by_age_band', age_band(age)] -= 1
+        counters['totals', 'actors'] -= len(rows)
+        ids = sorted(row[0] for row in rows)
+        record_changes('actor', 'delete', ids)
+        bump_stats(counters)
         db.session.commit()
+        return ids
 
-    def update(self):
+    # updates the actor only if its version is one of `versions` (any when
+    # None) and returns it, or None when there is no such actor or version
+    @classmethod
+    def update(cls, actor_id, values, versions=None):
+        rows = versioned_update(cls, actor_id, values, versions)
+        if rows is None:
+            return None
+        new, old = rows
+        if not values:
+            return cls(**new)
+        if (old['gender'], age_band(old['age'])) != (new['gender'], age_band(new['age'])):
+            track_actor(old['gender'], old['age'], -1)
+            track_actor(new['gender'], new['age'], 1)
+        actor = cls(**new)
+        record_change('actor', actor_id, 'update', actor.serialize())
         db.session.commit()
+        return actor
 
     def format(self):
         return f"{self.name} - {self.age} - {self.gender}"
 
+    def serialize(self):
+        return {
+        'id': self.id,
+        'name': self.name,
+        'age': self.age,
+        'gender': self.gender
+        }
+
 
 class Movie(db.Model):
     __tablename__ = 'Movie'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(80), unique=True, nullable=False)
     release_date = db.Column(db.Date(), nullable=False)
-    actors = db.relationship('Actor', secondary=helper_table, backref=db.backref('movies', lazy=True))
+    # bumped by every update and sent as the ETag
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    actors = db.relationship('Actor', secondary=helper_table, passive_deletes=True,
+                             backref=db.backref('movies', lazy=True, passive_deletes=True))
 
-    def insert(self):
+    def insert(self, commit=True):
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
+        record_change('movie', self.id, 'insert', self.serialize())
+        track_movie(self.release_date, 0, 1)
+        if commit:
+            db.session.commit()
 
     def delete(self):
-        db.session.delete(self)
+        db.session.expunge(self)
+        Movie.delete_where(Movie.id == self.id)
+
+    # deletes all matching movies, and through the foreign key cascade their
+    # cast links, with one DELETE; returns the deleted ids
+    @classmethod
+    def delete_where(cls, condition):
+        sizes = {}
+
+        def count_links(targets):
+            sizes.update(db.session.query(helper_table.c.movie_id, db.func.count()).filter(
+                helper_table.c.movie_id.in_(targets)).group_by(helper_table.c.movie_id))
+
+        rows = delete_rows(cls, condition, ('id', 'release_date'), count_links)
+        counters = Counter()
+        for movie_id, release_date in rows:
+            counters['movies_per_year', str(release_date.year)] -= 1
+            counters['cast_size', str(sizes.get(movie_id, 0))] -= 1
+            counters['totals', 'castings'] -= sizes.get(movie_id, 0)
+        counters['totals', 'movies'] -= len(rows)
+        ids = sorted(row[0] for row in rows)
+        record_changes('movie', 'delete', ids)
+        bump_stats(counters)
         db.session.commit()
+        return ids
 
-    def update(self):
+    # updates the movie only if its version is one of `versions` (any when
+    # None) and returns it, or None when there is no such movie or version
+    @classmethod
+    def update(cls, movie_id, values, versions=None):
+        rows = versioned_update(cls, movie_id, values, versions)
+        if rows is None:
+            return None
+        new, old = rows
+        if not values:
+            return cls(**new)
+        if old['release_date'].year != new['release_date'].year:
+            bump_stat('movies_per_year', old['release_date'].year, -1)
+            bump_stat('movies_per_year', new['release_date'].year, 1)
+        movie = cls(**new)
+        record_change('movie', movie_id, 'update', movie.serialize())
+        db.session.commit()
+        return movie
+
+    # cast size statistics are read after record_change, which on PostgreSQL
+    # holds the change log lock, so concurrent castings cannot interleave
+    def add_actor(self, actor, start_date=None, end_date=None):
+        record_change('cast', self.id, 'insert', cast_data(self.id, actor.id, start_date, end_date))
+        track_cast(cast_sizes([self.id]), 1)
+        db.session.execute(helper_table.insert().values(
+            movie_id=self.id, actor_id=actor.id, start_date=start_date, end_date=end_date))
+        db.session.commit()
+        db.session.expire(self, ['actors'])
+
+    def schedule_actor(self, actor, start_date, end_date):
+        db.session.execute(helper_table.update().where(
+            (helper_table.c.movie_id == self.id) & (helper_table.c.actor_id == actor.id)
+        ).values(start_date=start_date, end_date=end_date))
+        record_change('cast', self.id, 'update', cast_data(self.id, actor.id, start_date, end_date))
+        db.session.commit()
+
+    def remove_actor(self, actor):
+        record_change('cast', self.id, 'delete', cast_data(self.id, actor.id))
+        track_cast(cast_sizes([self.id]), -1)
+        self.actors.remove(actor)
         db.session.commit()
 
     def format(self):
         return f"{self.title} - {self.release_date}"
 
+    def serialize(self):
+        return {
+        'id': self.id,
+        'title': self.title,
+        'release_date': self.release_date.isoformat()
+        }
+
+
+
 
 
 
 
+'''
+Job
+A unit of background work (export, import, statistics rebuild) queued in the
+database and executed by `python manage.py jobs_worker`. Payload and result
+are stored as JSON text.
+'''
+class Job(db.Model):
+    __tablename__ = 'Job'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    payload = db.Column(db.Text)
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    progress = db.Column(db.Float, nullable=False, default=0)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64))
+    locked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_job_status_run_after', 'status', 'run_after'),)
+
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def format(self):
+        return {
+        'job_id': self.id,
+        'kind': self.kind,
+        'status': self.status,
+        'attempts': self.attempts,
+        'max_attempts': self.max_attempts,
+        'progress': self.progress,
+        'result': json.loads(self.result) if self.result else None,
+        'error': self.error,
+        'created_at': self.created_at.isoformat() + 'Z',
+        'updated_at': self.updated_at.isoformat() + 'Z'
+        }
 
 
 '''
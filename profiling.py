@@ -0,0 +1,188 @@
+import cProfile
+import hmac
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+
+# requests sending this value in the X-Profile header are profiled
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+# share of all other requests that are profiled, from 0 to 1
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# "cprofile" records every call and writes pstats files; "sample" reads the
+# request thread's stack every PROFILE_INTERVAL seconds and writes
+# collapsed stacks, for flame graphs, at far lower overhead
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/casting-agency-profiles')
+# profiles kept on disk; older ones are removed
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+EXTENSIONS = {'cprofile': 'pstats', 'sample': 'folded'}
+
+
+def profiling_enabled():
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+'''
+StackSampler
+A statistical profiler for one thread: a background thread reads the
+thread's current stack at a fixed interval and counts each distinct stack.
+Stacks are cut at the first frame running `root`. Samples are taken at
+most as often as the interpreter switches threads (sys.getswitchinterval).
+'''
+class StackSampler:
+    def __init__(self, interval=PROFILE_INTERVAL, root=None):
+        self.interval = interval
+        self.root = root
+        self.stacks = Counter()
+        self._stop = threading.Event()
+
+    def enable(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None and frame.f_code is not self.root:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            # a sample taken while the request thread stops the sampler
+            # belongs to the profiler, not the request
+            if stack and not self._stop.is_set():
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump_stats(self, path):
+        with open(path, 'w') as out:
+            for stack, count in self.stacks.most_common():
+                out.write(f'{stack} {count}\n')
+
+
+'''
+ProfilingMiddleware
+Wraps the WSGI app only when profiling is configured, so requests pay
+nothing otherwise. A profiled request runs under the profiler from the
+moment it enters Flask until its response is built, which covers
+requires_auth, the queries and serialization; streamed bodies are not
+followed. Each profile is written to PROFILE_DIR next to a JSON file with
+the route, status and timing, and named in the X-Profile-Id header.
+'''
+class ProfilingMiddleware:
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self._sequence = itertools.count()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    def wanted(self, environ):
+        token = environ.get(PROFILE_HEADER)
+        if token and PROFILE_TOKEN and hmac.compare_digest(token, PROFILE_TOKEN):
+            return True
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    def route(self, environ):
+        try:
+            rule, _ = self.app.url_map.bind_to_environ(environ).match(return_rule=True)
+            return rule.rule
+        except Exception:
+            return environ.get('PATH_INFO', '')
+
+    def __call__(self, environ, start_response):
+        if not self.wanted(environ):
+            return self.wsgi_app(environ, start_response)
+
+        now = datetime.utcnow()
+        name = f'{now:%Y%m%dT%H%M%S%f}-{os.getpid()}-{next(self._sequence)}.{EXTENSIONS[PROFILE_MODE]}'
+        status = []
+
+        def profiled_start_response(response_status, headers, exc_info=None):
+            status.append(int(response_status.split()[0]))
+            return start_response(response_status, headers + [('X-Profile-Id', name)], exc_info)
+
+        if PROFILE_MODE == 'sample':
+            profiler = StackSampler(root=ProfilingMiddleware.__call__.__code__)
+        else:
+            profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler already runs in this process (Python 3.12+
+            # allows only one cProfile at a time); serve the request as is
+            return self.wsgi_app(environ, start_response)
+
+        start = time.perf_counter()
+        try:
+            return self.wsgi_app(environ, profiled_start_response)
+        finally:
+            duration = time.perf_counter() - start
+            profiler.disable()
+            self.save(profiler, name, {
+                'name': name,
+                'method': environ.get('REQUEST_METHOD'),
+                'route': self.route(environ),
+                'path': environ.get('PATH_INFO'),
+                'status': status[0] if status else None,
+                'duration_ms': round(duration * 1000, 3),
+                'mode': PROFILE_MODE,
+                'pid': os.getpid(),
+                'created_at': now.isoformat() + 'Z'
+            })
+
+    def save(self, profiler, name, meta):
+        try:
+            profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+            with open(os.path.join(PROFILE_DIR, name + '.json'), 'w') as out:
+                json.dump(meta, out)
+            prune()
+        except OSError:
+            self.app.logger.warning('could not store profile %s', name, exc_info=True)
+
+
+def list_profiles():
+    profiles = []
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return profiles
+    for name in sorted(names, reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as meta:
+                profiles.append(json.load(meta))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def prune(keep=PROFILE_KEEP):
+    names = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+    for name in names[:max(0, len(names) - keep)]:
+        for path in (name, name[:-len('.json')]):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, path))
+            except FileNotFoundError:
+                pass
+
+
+def install(app):
+    if profiling_enabled():
+        if PROFILE_MODE not in EXTENSIONS:
+            raise ValueError(f'PROFILE_MODE must be one of {", ".join(sorted(EXTENSIONS))}, not {PROFILE_MODE!r}')
+        app.wsgi_app = ProfilingMiddleware(app, app.wsgi_app)
@@ -0,0 +1,223 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from models import db
+
+
+# off unless set to 1, so local runs and the test suite are not limited
+RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', '0') != '0'
+RATELIMIT_FILE = os.environ.get('RATELIMIT_FILE', '/tmp/casting-agency-ratelimit')
+RATELIMIT_SLOTS = int(os.environ.get('RATELIMIT_SLOTS', 65536))
+# requests per second and burst size for permissions without their own quota
+RATELIMIT_DEFAULT = os.environ.get('RATELIMIT_DEFAULT', '10:40')
+# comma separated permission=rate:burst or endpoint=rate:burst overrides,
+# e.g. "get:actors=1:5,delete_actors=0.5:2"
+RATELIMIT_QUOTAS = os.environ.get('RATELIMIT_QUOTAS', '')
+# reverse proxies in front of the app; the client IP is read from
+# X-Forwarded-For only when this is set, as werkzeug's ProxyFix does
+RATELIMIT_TRUSTED_PROXIES = int(os.environ.get('RATELIMIT_TRUSTED_PROXIES', 0))
+# full-table listings, queued exports / imports and bulk deletes get
+# tighter quotas than single-row reads and writes. The bulk deletes share
+# their permission with single deletes, so they are keyed by endpoint.
+DEFAULT_QUOTAS = {
+    'get:actors': (2, 10),
+    'get:movies': (2, 10),
+    'get:changes': (5, 20),
+    'post:jobs': (0.2, 5),
+    'delete_actors': (0.5, 5),
+    'delete_movies': (0.5, 5),
+}
+
+# shed load when, of the pool checkouts made in the last SHED_WINDOW
+# seconds (at least SHED_MIN_CHECKOUTS of them), more than SHED_THRESHOLD
+# left every connection of the pool in use, so that the next request had
+# to queue for one
+SHED_THRESHOLD = float(os.environ.get('SHED_THRESHOLD', 0.9))
+SHED_WINDOW = float(os.environ.get('SHED_WINDOW', 5))
+SHED_MIN_CHECKOUTS = int(os.environ.get('SHED_MIN_CHECKOUTS', 20))
+
+
+def parse_quota(value):
+    rate, burst = value.split(':')
+    return float(rate), float(burst)
+
+
+def load_quotas():
+    quotas = dict(DEFAULT_QUOTAS)
+    for entry in filter(None, RATELIMIT_QUOTAS.split(',')):
+        permission, quota = entry.strip().split('=')
+        quotas[permission] = parse_quota(quota)
+    return quotas
+
+
+## RateLimited Exception
+'''
+RateLimited Exception
+Raised with 429 when a client ran out of tokens and 503 when the worker is
+shedding load; retry_after is the number of seconds to wait.
+'''
+class RateLimited(Exception):
+    def __init__(self, status_code, retry_after):
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+'''
+SharedBuckets
+Token buckets in a memory-mapped file, so every gunicorn worker on the host
+draws from the same buckets. The file is an open-addressed hash table of
+(key hash, tokens, last update) slots guarded by flock. A slot idle long
+enough to have refilled is as good as empty and gets reused.
+'''
+class SharedBuckets:
+    SLOT = struct.Struct('<Qdd')
+    PROBES = 8
+
+    def __init__(self, path=RATELIMIT_FILE, slots=RATELIMIT_SLOTS):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _open(self):
+        # flock does not exclude processes sharing one open file, so every
+        # forked worker opens the file again
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * self.SLOT.size
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+        self._pid = os.getpid()
+
+    def take(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        first = key_hash % self.slots
+
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot, tokens, updated = None, burst, now
+                free, oldest = None, None
+                for probe in range(self.PROBES):
+                    offset = ((first + probe) % self.slots) * self.SLOT.size
+                    slot_hash, slot_tokens, slot_updated = self.SLOT.unpack_from(self._map, offset)
+                    if slot_hash == key_hash:
+                        slot, tokens, updated = offset, slot_tokens, slot_updated
+                        break
+                    if free is None and (slot_hash == 0 or now - slot_updated > burst / rate):
+                        free = offset
+                    if oldest is None or slot_updated < oldest[1]:
+                        oldest = (offset, slot_updated)
+                if slot is None:
+                    slot = free if free is not None else oldest[0]
+
+                tokens = min(burst, tokens + max(0, now - updated) * rate)
+                retry_after = 0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    retry_after = (1 - tokens) / rate
+                self.SLOT.pack_into(self._map, slot, key_hash, tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return retry_after
+
+
+'''
+RateLimiter
+Called by requires_auth once the token is verified. Limits each client, the
+JWT `sub` or else the client IP, per permission, and sheds load with 503
+while the database pool is exhausted. Pool use is sampled from the pool's
+checkout events, so every query of the worker counts and none is made
+just to measure it.
+'''
+class RateLimiter:
+    def __init__(self, buckets=None, quotas=None, trusted_proxies=RATELIMIT_TRUSTED_PROXIES):
+        self.buckets = buckets or SharedBuckets()
+        self.trusted_proxies = trusted_proxies
+        self.quotas = load_quotas() if quotas is None else quotas
+        self.default = parse_quota(RATELIMIT_DEFAULT)
+        self._checkouts = deque()
+        self._pools = set()
+        self._lock = threading.Lock()
+        self.metrics = {'limited': 0, 'shed': 0}
+
+    # `forwarded` holds the X-Forwarded-For header values of the request
+    def key_for(self, payload, remote_addr, forwarded):
+        if payload.get('sub'):
+            return 'sub:' + payload['sub']
+        # X-Forwarded-For is whatever the client sent, except for the
+        # entries appended by the proxies we run
+        forwarded = [address.strip() for value in forwarded for address in value.split(',')]
+        if self.trusted_proxies and len(forwarded) >= self.trusted_proxies:
+            return 'ip:' + forwarded[-self.trusted_proxies]
+        return 'ip:' + (remote_addr or '')
+
+    def client_key(self, payload):
+        return self.key_for(payload, request.remote_addr, request.headers.getlist('X-Forwarded-For'))
+
+    def watch(self, engine):
+        pool = engine.pool
+        with self._lock:
+            if pool in self._pools:
+                return
+            self._pools.add(pool)
+        # only a QueuePool with a bounded overflow makes requests queue
+        if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+            return
+        capacity = pool.size() + pool._max_overflow
+
+        @event.listens_for(pool, 'checkout')
+        def sample(dbapi_connection, connection_record, connection_proxy):
+            with self._lock:
+                self._checkouts.append((time.monotonic(), pool.checkedout() >= capacity))
+
+    def pool_saturation(self):
+        with self._lock:
+            horizon = time.monotonic() - SHED_WINDOW
+            while self._checkouts and self._checkouts[0][0] < horizon:
+                self._checkouts.popleft()
+            if len(self._checkouts) < SHED_MIN_CHECKOUTS:
+                return 0
+            return sum(full for _, full in self._checkouts) / len(self._checkouts)
+
+    # an endpoint with a quota of its own draws from its own bucket
+    def limit(self, permission, client, endpoint=None):
+        name = endpoint if endpoint in self.quotas else permission
+        rate, burst = self.quotas.get(name, self.default)
+        retry_after = self.buckets.take(f'{client}|{name}', rate, burst)
+        if retry_after:
+            with self._lock:
+                self.metrics['limited'] += 1
+            raise RateLimited(429, retry_after)
+
+    def check(self, permission, payload):
+        self.limit(permission, self.client_key(payload), request.endpoint)
+
+        self.watch(db.engine)
+        # samples older than the window expire, so shedding stops by itself
+        # once the pool has been left alone for SHED_WINDOW seconds
+        if self.pool_saturation() > SHED_THRESHOLD:
+            with self._lock:
+                self.metrics['shed'] += 1
+            raise RateLimited(503, SHED_WINDOW)
+
+    def snapshot(self):
+        saturation = round(self.pool_saturation(), 3)
+        with self._lock:
+            return dict(self.metrics, pool_saturation=saturation)
@@ -0,0 +1,208 @@
+import os
+import threading
+from datetime import date
+
+from models import db, helper_table, Actor, Change
+from changes import fetch_changes, CHANGES_PAGE_SIZE
+
+
+# pending booking edits are folded into a fresh tree once they outnumber
+# this share of the indexed bookings
+SCHEDULE_REBUILD_RATIO = float(os.environ.get('SCHEDULE_REBUILD_RATIO', 0.1))
+SCHEDULE_REBUILD_MIN = int(os.environ.get('SCHEDULE_REBUILD_MIN', 1000))
+
+
+def parse_date(value):
+    y, m , d = value.split('-')
+    return date(int(y), int(m), int(d))
+
+
+'''
+IntervalTree
+A static centered interval tree over closed integer intervals. Every node
+keeps the intervals containing its center twice, sorted by start and by
+descending end, so an overlap query only walks the part of each list that
+can match.
+'''
+class IntervalTree:
+    def __init__(self, intervals):
+        self.root = self._build(list(intervals))
+        self.size = len(intervals)
+
+    def _build(self, intervals):
+        if not intervals:
+            return None
+        points = sorted(point for interval in intervals for point in interval[:2])
+        center = points[len(points) // 2]
+        left, right, here = [], [], []
+        for interval in intervals:
+            if interval[1] < center:
+                left.append(interval)
+            elif interval[0] > center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        return (center,
+                sorted(here, key=lambda interval: interval[0]),
+                sorted(here, key=lambda interval: interval[1], reverse=True),
+                self._build(left),
+                self._build(right))
+
+    def overlapping(self, start, end):
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            center, by_start, by_end, left, right = node
+            if end < center:
+                for interval in by_start:
+                    if interval[0] > end:
+                        break
+                    found.append(interval)
+                stack.append(left)
+            elif start > center:
+                for interval in by_end:
+                    if interval[1] < start:
+                        break
+                    found.append(interval)
+                stack.append(right)
+            else:
+                found.extend(by_start)
+                stack.append(left)
+                stack.append(right)
+        return found
+
+
+'''
+BookingIndex
+Every actor id plus the scheduled castings as (start, end, actor_id, movie_id)
+intervals, with dates stored as ordinals. Built from the database on first use
+and kept current by replaying the change log, like the co-star graph. The
+bookings are also indexed by actor and by movie, so deleting either only
+touches its own bookings.
+'''
+class BookingIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.cursor = None
+        self.load([], [], None)
+
+    def load(self, actor_ids, bookings, cursor):
+        self.actor_ids = set(actor_ids)
+        self.bookings = {(actor_id, movie_id): (start, end, actor_id, movie_id)
+                         for start, end, actor_id, movie_id in bookings}
+        self.tree = IntervalTree(self.bookings.values())
+        self.movies_of = {}
+        self.actors_of = {}
+        for actor_id, movie_id in self.bookings:
+            self.movies_of.setdefault(actor_id, set()).add(movie_id)
+            self.actors_of.setdefault(movie_id, set()).add(actor_id)
+        self.added = {}
+        self.removed = set()
+        self.cursor = cursor
+
+    def book(self, actor_id, movie_id, start, end):
+        self.unbook(actor_id, movie_id)
+        booking = (start, end, actor_id, movie_id)
+        self.bookings[(actor_id, movie_id)] = booking
+        self.added[(actor_id, movie_id)] = booking
+        self.movies_of.setdefault(actor_id, set()).add(movie_id)
+        self.actors_of.setdefault(movie_id, set()).add(actor_id)
+
+    def unbook(self, actor_id, movie_id):
+        booking = self.bookings.pop((actor_id, movie_id), None)
+        if booking is None:
+            return
+        self._forget(self.movies_of, actor_id, movie_id)
+        self._forget(self.actors_of, movie_id, actor_id)
+        if self.added.pop((actor_id, movie_id), None) is None:
+            self.removed.add(booking)
+
+    @staticmethod
+    def _forget(index, key, value):
+        values = index.get(key)
+        values.discard(value)
+        if not values:
+            del index[key]
+
+    def apply(self, change):
+        entity, op, data = change['entity'], change['op'], change['data']
+        if entity == 'actor' and op == 'insert':
+            self.actor_ids.add(change['id'])
+        elif entity == 'actor' and op == 'delete':
+            self.actor_ids.discard(change['id'])
+            for movie_id in list(self.movies_of.get(change['id'], ())):
+                self.unbook(change['id'], movie_id)
+        elif entity == 'movie' and op == 'delete':
+            for actor_id in list(self.actors_of.get(change['id'], ())):
+                self.unbook(actor_id, change['id'])
+        elif entity == 'cast':
+            self.unbook(data['actor_id'], data['movie_id'])
+            if op != 'delete' and data.get('start_date') and data.get('end_date'):
+                self.book(data['actor_id'], data['movie_id'],
+                          parse_date(data['start_date']).toordinal(),
+                          parse_date(data['end_date']).toordinal())
+        self.cursor = change['cursor']
+
+    def busy(self, start, end):
+        start, end = start.toordinal(), end.toordinal()
+        busy = {booking[2] for booking in self.tree.overlapping(start, end)
+                if booking not in self.removed}
+        busy.update(booking[2] for booking in self.added.values()
+                    if booking[0] <= end and booking[1] >= start)
+        return busy
+
+    def available(self, start, end):
+        return sorted(self.actor_ids - self.busy(start, end))
+
+    def build(self):
+        cursor = db.session.query(db.func.max(Change.id)).scalar() or 0
+        actor_ids = [actor_id for actor_id, in db.session.query(Actor.id)]
+        rows = db.session.query(helper_table.c.start_date, helper_table.c.end_date,
+                                helper_table.c.actor_id, helper_table.c.movie_id).filter(
+            helper_table.c.start_date.isnot(None), helper_table.c.end_date.isnot(None))
+        bookings = [(start.toordinal(), end.toordinal(), actor_id, movie_id)
+                    for start, end, actor_id, movie_id in rows]
+        db.session.rollback()
+        self.load(actor_ids, bookings, cursor)
+
+    def sync(self):
+        with self.lock:
+            if self.cursor is None:
+                self.build()
+                return
+            while True:
+                changes = fetch_changes(self.cursor)
+                for change in changes:
+                    self.apply(change)
+                if len(changes) < CHANGES_PAGE_SIZE:
+                    break
+            pending = len(self.added) + len(self.removed)
+            if pending > max(SCHEDULE_REBUILD_MIN, len(self.bookings) * SCHEDULE_REBUILD_RATIO):
+                self.load(self.actor_ids, list(self.bookings.values()), self.cursor)
+
+
+booking_index = BookingIndex()
+
+
+def find_conflicts(actor_id, start, end, exclude_movie_id=None):
+    query = db.session.query(helper_table.c.movie_id, helper_table.c.start_date, helper_table.c.end_date).filter(
+        helper_table.c.actor_id == actor_id,
+        helper_table.c.start_date.isnot(None),
+        helper_table.c.end_date.isnot(None))
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # matches the GiST index on (actor_id, daterange(start_date, end_date, '[]'))
+        query = query.filter(db.text(
+            "daterange(start_date, end_date, '[]') && daterange(:start, :end, '[]')"
+        ).bindparams(start=start, end=end))
+    else:
+        query = query.filter(helper_table.c.start_date <= end, helper_table.c.end_date >= start)
+    if exclude_movie_id is not None:
+        query = query.filter(helper_table.c.movie_id != exclude_movie_id)
+    return [{
+        'movie_id': movie_id,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat()
+        } for movie_id, start_date, end_date in query]
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import threading
+import time
+from functools import wraps
+from flask import request, make_response, Response
+
+from wire import prefers_msgpack
+
+
+SINGLEFLIGHT_TIMEOUT = float(os.environ.get('SINGLEFLIGHT_TIMEOUT', 5))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.duration = 0
+
+
+'''
+SingleFlight
+Runs at most one call per key at a time. Requests arriving while a call for
+their key is in flight wait for it and share its result instead of running
+it again; a waiter that gives up after `timeout` seconds runs its own call.
+'''
+class SingleFlight:
+    def __init__(self, timeout=SINGLEFLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.metrics = {'calls': 0, 'shared': 0, 'timeouts': 0, 'errors': 0, 'saved_seconds': 0.0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.metrics['calls'] += 1
+
+        if leader:
+            start = time.perf_counter()
+            try:
+                call.result = fn()
+                return call.result
+            except Exception as error:
+                call.error = error
+                raise
+            finally:
+                call.duration = time.perf_counter() - start
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(self.timeout):
+            with self._lock:
+                self.metrics['timeouts'] += 1
+            return fn()
+
+        with self._lock:
+            self.metrics['shared'] += 1
+            self.metrics['saved_seconds'] += call.duration
+            if call.error is not None:
+                self.metrics['errors'] += 1
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.metrics, in_flight=len(self._calls))
+
+    # shares the response of a read handler wrapped by requires_auth between
+    # concurrent requests for the same route, query string and permissions
+    def coalesce(self, f):
+        @wraps(f)
+        def wrapper(jwt, *args, **kwargs):
+            key = (
+                request.method,
+                request.path,
+                tuple(sorted(request.args.items(multi=True))),
+                # the format wire.respond answers in, not the client's
+                # first choice, which JSON can win ties against
+                prefers_msgpack(request.headers.get('Accept')),
+                tuple(sorted(jwt.get('permissions', [])))
+            )
+
+            def respond():
+                response = make_response(f(jwt, *args, **kwargs))
+                return response.get_data(), response.status_code, list(response.headers)
+
+            body, status, headers = self.do(key, respond)
+            return Response(body, status, headers)
+
+        return wrapper
+
+
+'''
+AsyncSingleFlight
+The same deduplication for coroutines running on one event loop, used by
+the ASGI entry point.
+'''
+class AsyncSingleFlight:
+    def __init__(self, timeout=SINGLEFLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self._calls = {}
+        self.metrics = {'calls': 0, 'shared': 0, 'timeouts': 0, 'errors': 0, 'saved_seconds': 0.0}
+
+    async def do(self, key, fn):
+        call = self._calls.get(key)
+        if call is None:
+            future = asyncio.get_running_loop().create_future()
+            self._calls[key] = future
+            self.metrics['calls'] += 1
+            start = time.perf_counter()
+            try:
+                result = await fn()
+                future.set_result((result, time.perf_counter() - start))
+                return result
+            except asyncio.CancelledError:
+                # the waiters run the call again under a new leader
+                future.cancel()
+                raise
+            except Exception as error:
+                future.set_exception(error)
+                # mark the exception as retrieved when nobody was waiting
+                future.exception()
+                raise
+            finally:
+                # resolved whatever ended the call, so no waiter hangs
+                if not future.done():
+                    future.cancel()
+                del self._calls[key]
+
+        try:
+            result, duration = await asyncio.wait_for(asyncio.shield(call), self.timeout)
+        except asyncio.TimeoutError:
+            self.metrics['timeouts'] += 1
+            return await fn()
+        except asyncio.CancelledError:
+            # only the leader's call was cancelled, not this request; the
+            # first waiter back becomes the new leader, the others share it
+            if not call.cancelled():
+                raise
+            return await self.do(key, fn)
+        except Exception:
+            self.metrics['shared'] += 1
+            self.metrics['errors'] += 1
+            raise
+        self.metrics['shared'] += 1
+        self.metrics['saved_seconds'] += duration
+        return result
+
+    def snapshot(self):
+        return dict(self.metrics, in_flight=len(self._calls))
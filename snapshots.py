@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import bindparam
+from sqlalchemy.ext import baked
+
+from models import db, Actor, Movie
+from changes import notifier
+
+
+SNAPSHOT_CACHE_SIZE = int(os.environ.get('SNAPSHOT_CACHE_SIZE', 4096))
+# seconds a snapshot is served while LISTEN/NOTIFY delivers the writes of
+# every worker, and otherwise, when only this worker's own writes are seen
+SNAPSHOT_TTL = float(os.environ.get('SNAPSHOT_TTL', 300))
+SNAPSHOT_POLL_TTL = float(os.environ.get('SNAPSHOT_POLL_TTL', 2))
+
+# the SQL of these lookups is built and compiled once, on first use
+bakery = baked.bakery()
+
+ACTOR_LOOKUP = bakery(lambda session: session.query(
+    Actor.id, Actor.name, Actor.age, Actor.gender, Actor.version))
+ACTOR_LOOKUP += lambda query: query.filter(Actor.id == bindparam('id'))
+
+MOVIE_LOOKUP = bakery(lambda session: session.query(
+    Movie.id, Movie.title, Movie.release_date, Movie.version))
+MOVIE_LOOKUP += lambda query: query.filter(Movie.id == bindparam('id'))
+
+
+'''
+SnapshotCache
+A per-worker LRU of immutable rows, keyed by (entity, id). Entries are
+dropped when the change log announces a write to their row: straight away
+for this worker's commits and through LISTEN/NOTIFY for the others on
+PostgreSQL. Without a LISTEN connection entries expire after
+SNAPSHOT_POLL_TTL seconds, and the cache is emptied whenever one is made.
+'''
+class SnapshotCache:
+    def __init__(self, size=SNAPSHOT_CACHE_SIZE):
+        self.size = size
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped by every invalidation, so a row read before a write but
+        # stored after its invalidation is not kept
+        self._generation = 0
+        self.metrics = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        notifier.subscribe(self.invalidate, reset=self.clear)
+
+    def get(self, entity, entity_id, load):
+        key = (entity, entity_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._rows.get(key)
+            if entry is not None and entry[1] > now:
+                self._rows.move_to_end(key)
+                self.metrics['hits'] += 1
+                return entry[0]
+            self.metrics['misses'] += 1
+            generation = self._generation
+
+        row = load(entity_id)
+        if row is None:
+            return None
+        ttl = SNAPSHOT_TTL if notifier.connected else SNAPSHOT_POLL_TTL
+        with self._lock:
+            if generation == self._generation:
+                self._rows[key] = (row, now + ttl)
+                self._rows.move_to_end(key)
+                if len(self._rows) > self.size:
+                    self._rows.popitem(last=False)
+        return row
+
+    def invalidate(self, changes):
+        with self._lock:
+            self._generation += 1
+            for _, entity, entity_id in changes:
+                if self._rows.pop((entity, entity_id), None) is not None:
+                    self.metrics['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._rows.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.metrics, size=len(self._rows))
+
+
+snapshots = SnapshotCache()
+
+
+def load_actor(actor_id):
+    return ACTOR_LOOKUP(db.session()).params(id=actor_id).one_or_none()
+
+
+def load_movie(movie_id):
+    return MOVIE_LOOKUP(db.session()).params(id=movie_id).one_or_none()
+
+
+# read-only rows with the columns of Actor / Movie as attributes
+def actor_snapshot(actor_id):
+    return snapshots.get('actor', actor_id, load_actor)
+
+
+def movie_snapshot(movie_id):
+    return snapshots.get('movie', movie_id, load_movie)
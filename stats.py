@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from models import db, helper_table, Actor, Movie, Stat, age_band
+
+
+# longest time, in seconds, a worker serves statistics without re-reading them
+STATS_MAX_AGE = float(os.environ.get('STATS_MAX_AGE', 5))
+
+STAT_NAMES = ('totals', 'movies_per_year', 'actors_by_gender', 'actors_by_age_band', 'cast_size')
+
+_cache = {'stats': None, 'as_of': None, 'expires': 0}
+_cache_lock = threading.Lock()
+
+
+def read_stats():
+    stats = {name: {} for name in STAT_NAMES}
+    for name, bucket, value in db.session.query(Stat.name, Stat.bucket, Stat.value):
+        if value:
+            stats.setdefault(name, {})[bucket] = value
+    return stats
+
+
+def current_stats(max_age=STATS_MAX_AGE):
+    with _cache_lock:
+        if _cache['expires'] > time.monotonic():
+            return _cache['stats'], _cache['as_of']
+        _cache['stats'] = read_stats()
+        _cache['as_of'] = datetime.utcnow()
+        _cache['expires'] = time.monotonic() + max_age
+        return _cache['stats'], _cache['as_of']
+
+
+# recomputes every counter from the catalogue tables; needed once after the
+# Stat table is created and safe to rerun, as concurrent writers wait on the
+# table lock on PostgreSQL
+def rebuild_stats():
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute('LOCK TABLE "Stat" IN EXCLUSIVE MODE')
+    counters = []
+
+    actors = db.session.query(Actor.gender, Actor.age).all()
+    for gender, age in actors:
+        counters.append(('actors_by_gender', gender))
+        counters.append(('actors_by_age_band', age_band(age)))
+
+    sizes = dict(db.session.query(helper_table.c.movie_id, db.func.count()).group_by(helper_table.c.movie_id))
+    movies = db.session.query(Movie.id, Movie.release_date).all()
+    for movie_id, release_date in movies:
+        counters.append(('movies_per_year', str(release_date.year)))
+        counters.append(('cast_size', str(sizes.get(movie_id, 0))))
+
+    values = {}
+    for counter in counters:
+        values[counter] = values.get(counter, 0) + 1
+    values[('totals', 'actors')] = len(actors)
+    values[('totals', 'movies')] = len(movies)
+    values[('totals', 'castings')] = sum(sizes.values())
+
+    Stat.query.delete()
+    db.session.bulk_insert_mappings(Stat, [
+        {'name': name, 'bucket': bucket, 'value': value} for (name, bucket), value in values.items()
+    ])
+    db.session.commit()
@@ -10,13 +10,23 @@ from models import setup_db, Actor , Movie
 
 class CapstoneTestCase(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        """Build the app and the test database once for the whole class."""
+        cls.app = create_app()
+        cls.database_name = "casting_agency_test"
+        cls.database_path = f"postgresql://omar@:5432/{cls.database_name}"
+        setup_db(cls.app, cls.database_path)
+        # binds the app to the current context
+        with cls.app.app_context():
+            cls.db = SQLAlchemy()
+            cls.db.init_app(cls.app)
+            # create all tables
+            cls.db.create_all()
+
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
+        """Define test variables."""
         self.client = self.app.test_client
-        self.database_name = "casting_agency_test"
-        self.database_path = f"postgresql://omar@:5432/{self.database_name}"
-        setup_db(self.app, self.database_path)
 
         self.new_actor = {
         "name": "Dwayne Johnson",
@@ -34,12 +44,6 @@ class CapstoneTestCase(unittest.TestCase):
         self.casting_assistant = os.environ.get('ASSISTANT')
         self.casting_director = os.environ.get('DIRECTOR')
         self.executive_producer = os.environ.get('PRODUCER')
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
 
     def tearDown(self):
         """Executed after reach test"""
@@ -47,6 +51,18 @@ class CapstoneTestCase(unittest.TestCase):
 
 
 
+    ## Startup tests
+    ########################################################################
+    def test_auth0_client_registered_on_first_use(self):
+        app = create_app()
+        self.assertNotIn('auth0', app.extensions)
+
+        res = app.test_client().get('/logout')
+
+        self.assertEqual(res.status_code, 302)
+        self.assertIn('auth0', app.extensions)
+
+
     ## Actor tests
     ########################################################################
     def test_add_actor(self):
@@ -60,6 +76,29 @@ class CapstoneTestCase(unittest.TestCase):
         self.assertTrue(len(data['actors']))
 
 
+    def test_add_and_update_actor_with_string_age(self):
+        res = self.client().post('/actors',headers={"Authorization": "Bearer {}".format(self.casting_director)},
+                                                json= {"name": "String Age","age": "27","gender": "f"})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+
+        res = self.client().patch('/actors/{}'.format(data['created_id']), headers={"Authorization": "Bearer {}".format(self.casting_director)},
+                                                json= {"age": "28"})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actor'], ["String Age - 28 - f"])
+
+
+    def test_400_add_actor_with_invalid_age(self):
+        res = self.client().post('/actors',headers={"Authorization": "Bearer {}".format(self.casting_director)},
+                                                json= {"name": "Bad Age","age": "old","gender": "f"})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+
     def test_400_no_inputs_for_add_actor(self):
         res = self.client().post('/actors',headers={"Authorization": "Bearer {}".format(self.casting_director)})
 
@@ -84,6 +123,42 @@ class CapstoneTestCase(unittest.TestCase):
         self.assertEqual(data['deleted'], actor_id)
 
 
+    def test_bulk_delete_actors(self):
+        ids = []
+        for name in ["Bulk One", "Bulk Two"]:
+            res = self.client().post('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"name": name,"age": 25,"gender": "m"})
+            ids.append(json.loads(res.data)['created_id'])
+
+        res = self.client().delete('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"ids": ids})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['deleted'], sorted(ids))
+
+
+    def test_400_bulk_delete_actors_failure(self): # unknown filter
+        res = self.client().delete('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"filter": {"height": 180}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+
+    def test_400_bulk_delete_actors_ids_not_a_list(self):
+        res = self.client().delete('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"ids": "123"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+
     def test_422_delete_actor_failure(self):
         res = self.client().delete('/actors/1000', headers={"Authorization": "Bearer {}".format(self.casting_director)})
         data = json.loads(res.data)
@@ -120,6 +195,29 @@ class CapstoneTestCase(unittest.TestCase):
         self.assertTrue(data['actors'])
 
 
+    def test_head_actors_counts(self):
+        res = self.client().head('/actors', headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
+        total = int(res.headers['X-Total-Count'])
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data, b'')
+
+        res = self.client().get('/actors?page=1&per_page=1', headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(int(res.headers['X-Total-Count']), total)
+        self.assertTrue(len(data['actors']) <= 1)
+
+
+    def test_400_get_actors_page_failure(self): # page numbers start at 1
+        res = self.client().get('/actors?page=0', headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+
     def test_404_get_all_actors_failure(self): # no actors found
         res = self.client().get('/actors', headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
         data = json.loads(res.data)
@@ -129,6 +227,64 @@ class CapstoneTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'resource not found')
 
 
+    def test_update_actor_without_fields_keeps_version(self):
+        res = self.client().post('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"name": "Unchanged Actor","age": 35,"gender": "m"})
+        actor_id = json.loads(res.data)['created_id']
+        etag = self.client().get('/actors/{}'.format(actor_id), headers={"Authorization": "Bearer {}".format(self.casting_director)}).headers['ETag']
+
+        res = self.client().patch('/actors/{}'.format(actor_id), headers={"Authorization": "Bearer {}".format(self.casting_director)},
+                                                json= {"height": 180})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actor'], ["Unchanged Actor - 35 - m"])
+        self.assertEqual(res.headers['ETag'], etag)
+
+
+    def test_update_actor_with_if_match(self):
+        res = self.client().post('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"name": "Versioned Actor","age": 33,"gender": "f"})
+        actor_id = json.loads(res.data)['created_id']
+        res = self.client().get('/actors/{}'.format(actor_id), headers={"Authorization": "Bearer {}".format(self.casting_director)})
+        etag = res.headers['ETag']
+
+        res = self.client().patch('/actors/{}'.format(actor_id), headers={"Authorization": "Bearer {}".format(self.casting_director),
+                                    "If-Match": etag}, json = {"age": 34})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+
+    def test_412_update_actor_failure(self): # If-Match names an old version
+        res = self.client().post('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"name": "Stale Actor","age": 33,"gender": "f"})
+        actor_id = json.loads(res.data)['created_id']
+        self.client().patch('/actors/{}'.format(actor_id), headers={"Authorization": "Bearer {}".format(self.casting_director)},
+                                    json = {"age": 34})
+
+        res = self.client().patch('/actors/{}'.format(actor_id), headers={"Authorization": "Bearer {}".format(self.casting_director),
+                                    "If-Match": '"1"'}, json = {"age": 35})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 412)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'precondition failed')
+
+
+    def test_get_actor_after_update(self): # cached snapshot is dropped on write
+        res = self.client().post('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"name": "Cached Actor","age": 40,"gender": "m"})
+        actor_id = json.loads(res.data)['created_id']
+        self.client().get('/actors/{}'.format(actor_id), headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
+        self.client().patch('/actors/{}'.format(actor_id), headers={"Authorization": "Bearer {}".format(self.casting_director)},
+                                    json = {"age": 41})
+
+        res = self.client().get('/actors/{}'.format(actor_id), headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['age'], 41)
+
+
     def test_404_update_actor_failure(self): # no actor found with the given id
         res = self.client().patch('/actors/1000', headers={"Authorization": "Bearer {}".format(self.casting_director)},json = self.new_actor)
         data = json.loads(res.data)
@@ -248,6 +404,318 @@ class CapstoneTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'bad request')
 
 
+    ## Cast tests
+    ########################################################################
+    def test_add_cast(self):
+        actor_response = self.client().post('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"name": "Cast Member","age": 33,"gender": "f"})
+        movie_response = self.client().post('/movies', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"title": "Cast Movie","release_date": "2012-03-04"})
+        actor_id = json.loads(actor_response.data)['created_id']
+        movie_id = json.loads(movie_response.data)['created_id']
+
+        res = self.client().post(f'/movies/{movie_id}/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"actor_id": actor_id})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn(actor_id, data['actors'])
+
+
+    def test_400_add_cast_failure(self): # actor id is not an integer
+        res = self.client().post('/movies/1/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"actor_id": "1"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+
+    def test_404_delete_cast_failure(self): # actor is not part of the cast
+        res = self.client().delete('/movies/1/actors/1000', headers={"Authorization": "Bearer {}".format(self.executive_producer)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
+
+    ## Scheduling tests
+    ########################################################################
+    def test_409_overlapping_booking_failure(self):
+        headers = {"Authorization": "Bearer {}".format(self.executive_producer)}
+        actor_id = json.loads(self.client().post('/actors', headers=headers,
+                                                json= {"name": "Busy Actor","age": 45,"gender": "m"}).data)['created_id']
+        first = json.loads(self.client().post('/movies', headers=headers,
+                                                json= {"title": "First Shoot","release_date": "2021-01-01"}).data)['created_id']
+        second = json.loads(self.client().post('/movies', headers=headers,
+                                                json= {"title": "Second Shoot","release_date": "2021-02-01"}).data)['created_id']
+        self.client().post(f'/movies/{first}/actors', headers=headers,
+                                                json= {"actor_id": actor_id, "start_date": "2020-05-01", "end_date": "2020-05-31"})
+
+        res = self.client().post(f'/movies/{second}/actors', headers=headers,
+                                                json= {"actor_id": actor_id, "start_date": "2020-05-20", "end_date": "2020-06-10"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'conflict')
+
+        res = self.client().get('/actors/available?start_date=2020-05-10&end_date=2020-05-12', headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn(actor_id, data['actors'])
+
+
+    def test_400_get_availability_failure(self): # window ends before it starts
+        res = self.client().get('/actors/1/availability?start_date=2020-05-10&end_date=2020-05-01', headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+
+    ## Co-star graph tests
+    ########################################################################
+    def test_get_separation(self):
+        headers = {"Authorization": "Bearer {}".format(self.executive_producer)}
+        first = json.loads(self.client().post('/actors', headers=headers,
+                                                json= {"name": "First Costar","age": 30,"gender": "f"}).data)['created_id']
+        second = json.loads(self.client().post('/actors', headers=headers,
+                                                json= {"name": "Second Costar","age": 31,"gender": "m"}).data)['created_id']
+        movie_id = json.loads(self.client().post('/movies', headers=headers,
+                                                json= {"title": "Costar Movie","release_date": "2011-05-06"}).data)['created_id']
+        self.client().post(f'/movies/{movie_id}/actors', headers=headers, json= {"actor_id": first})
+        self.client().post(f'/movies/{movie_id}/actors', headers=headers, json= {"actor_id": second})
+
+        res = self.client().get(f'/actors/{first}/separation/{second}', headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['degrees'], 1)
+        self.assertEqual(data['path'][1], {'movie_id': movie_id})
+
+
+    def test_get_costars_after_delete_and_recreate(self):
+        headers = {"Authorization": "Bearer {}".format(self.executive_producer)}
+        first = json.loads(self.client().post('/actors', headers=headers,
+                                                json= {"name": "Staying Costar","age": 40,"gender": "f"}).data)['created_id']
+        second = json.loads(self.client().post('/actors', headers=headers,
+                                                json= {"name": "Leaving Costar","age": 41,"gender": "m"}).data)['created_id']
+        movie_id = json.loads(self.client().post('/movies', headers=headers,
+                                                json= {"title": "Recast Movie","release_date": "2012-07-08"}).data)['created_id']
+        self.client().post(f'/movies/{movie_id}/actors', headers=headers, json= {"actor_id": first})
+        self.client().post(f'/movies/{movie_id}/actors', headers=headers, json= {"actor_id": second})
+        self.client().get(f'/actors/{first}/costars', headers=headers)
+
+        self.client().delete(f'/actors/{second}', headers=headers)
+        second = json.loads(self.client().post('/actors', headers=headers,
+                                                json= {"name": "Returning Costar","age": 41,"gender": "m"}).data)['created_id']
+        self.client().post(f'/movies/{movie_id}/actors', headers=headers, json= {"actor_id": second})
+
+        res = self.client().get(f'/actors/{first}/costars', headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn({'actor_id': second, 'distance': 1}, data['costars'])
+
+
+    def test_400_get_costars_failure(self): # too many hops
+        res = self.client().get('/actors/1/costars?hops=100', headers={"Authorization": "Bearer {}".format(self.casting_assistant)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+
+    ## Statistics tests
+    ########################################################################
+    def test_get_stats(self):
+        self.client().post('/movies', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"title": "Stats Movie","release_date": "1999-09-09"})
+        res = self.client().get('/stats', headers={"Authorization": "Bearer {}".format(self.executive_producer)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['stats']['totals']['movies'])
+        self.assertIn('movies_per_year', data['stats'])
+
+
+    ## ASGI tests
+    ########################################################################
+    def test_asgi_matches_wsgi_payload(self):
+        from starlette.testclient import TestClient
+        import asgi
+
+        headers = {"Authorization": "Bearer {}".format(self.casting_assistant)}
+        with TestClient(asgi.app) as asgi_client:
+            for path in ['/actors', '/movies', '/actors/1000']:
+                asgi_res = asgi_client.get(path, headers=headers)
+                res = self.client().get(path, headers=headers)
+
+                self.assertEqual(asgi_res.status_code, res.status_code)
+                self.assertEqual(asgi_res.json(), json.loads(res.data))
+
+
+    ## Rate limiting tests
+    ########################################################################
+    def test_429_rate_limit_failure(self):
+        import tempfile
+        from ratelimit import RateLimiter, RateLimited, SharedBuckets
+
+        with tempfile.NamedTemporaryFile() as store:
+            limiter = RateLimiter(SharedBuckets(store.name, 64), quotas={'get:actors': (0.01, 2)})
+            limiter.limit('get:actors', 'sub:test')
+            limiter.limit('get:actors', 'sub:test')
+
+            with self.assertRaises(RateLimited) as raised:
+                limiter.limit('get:actors', 'sub:test')
+            self.assertEqual(raised.exception.status_code, 429)
+            self.assertTrue(raised.exception.retry_after >= 1)
+            # other clients keep their own bucket
+            limiter.limit('get:actors', 'sub:other')
+
+
+    def test_pool_saturation_from_checkouts(self):
+        import ratelimit
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import QueuePool
+
+        engine = create_engine('sqlite://', poolclass=QueuePool, pool_size=1, max_overflow=0)
+        limiter = ratelimit.RateLimiter(quotas={})
+        limiter.watch(engine)
+        for _ in range(ratelimit.SHED_MIN_CHECKOUTS):
+            engine.connect().close()
+
+        # a pool of one is exhausted by every checkout
+        self.assertEqual(limiter.pool_saturation(), 1)
+
+
+    def test_rate_limit_ignores_forwarded_for_without_proxies(self):
+        from ratelimit import RateLimiter
+
+        headers = {"X-Forwarded-For": "203.0.113.7, 10.0.0.2"}
+        with self.app.test_request_context('/actors', headers=headers, environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+            self.assertEqual(RateLimiter(quotas={}).client_key({}), 'ip:10.0.0.1')
+            self.assertEqual(RateLimiter(quotas={}, trusted_proxies=1).client_key({}), 'ip:10.0.0.2')
+            self.assertEqual(RateLimiter(quotas={}, trusted_proxies=2).client_key({}), 'ip:203.0.113.7')
+
+
+    ## Metrics tests
+    ########################################################################
+    def test_get_metrics(self):
+        self.client().get('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)})
+        res = self.client().get('/metrics', headers={"Authorization": "Bearer {}".format(self.executive_producer)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['singleflight']['calls'])
+
+
+    ## Change feed tests
+    ########################################################################
+    def test_get_changes(self):
+        self.client().post('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"name": "Change Feed","age": 41,"gender": "m"})
+        res = self.client().get('/changes?since=0&wait=0', headers={"Authorization": "Bearer {}".format(self.executive_producer)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['changes'])
+        self.assertEqual(data['cursor'], data['changes'][-1]['cursor'])
+
+
+    def test_400_get_changes_failure(self): # cursor is not a number
+        res = self.client().get('/changes?since=abc', headers={"Authorization": "Bearer {}".format(self.executive_producer)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+
+    ## Background job tests
+    ########################################################################
+    def test_add_job(self):
+        res = self.client().post('/jobs', headers={"Authorization": "Bearer {}".format(self.executive_producer)},
+                                                json= {"kind": "export","payload": {"entities": ["actors"]}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(res.headers['Location'].endswith('/jobs/{}'.format(data['job_id'])))
+
+        res = self.client().get('/jobs/{}'.format(data['job_id']), headers={"Authorization": "Bearer {}".format(self.executive_producer)})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['job']['kind'], 'export')
+
+
+    def test_404_get_job_failure(self): # no job found with the given id
+        res = self.client().get('/jobs/100000', headers={"Authorization": "Bearer {}".format(self.executive_producer)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
+
+    ## Profiling tests
+    ########################################################################
+    def test_get_profiles(self):
+        res = self.client().get('/profiles', headers={"Authorization": "Bearer {}".format(self.executive_producer)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIsInstance(data['profiles'], list)
+
+
+    def test_404_download_profile_failure(self): # no profile with that name
+        res = self.client().get('/profiles/missing.pstats', headers={"Authorization": "Bearer {}".format(self.executive_producer)})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
+
+    ## Wire format tests
+    ########################################################################
+    def test_get_actors_msgpack_columns(self):
+        import msgpack
+
+        res = self.client().get('/actors?layout=columns', headers={"Authorization": "Bearer {}".format(self.casting_assistant),
+                                    "Accept": "application/msgpack"})
+        data = msgpack.unpackb(res.data, raw=False)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/msgpack')
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['actors']['actor_id']), len(data['actors']['actor_name']))
+
+
+    def test_add_actor_msgpack_body(self):
+        import msgpack
+
+        res = self.client().post('/actors', headers={"Authorization": "Bearer {}".format(self.executive_producer),
+                                    "Content-Type": "application/msgpack"},
+                                    data= msgpack.packb({"name": "Packed Actor","age": 28,"gender": "f"}))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
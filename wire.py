@@ -0,0 +1,67 @@
+import msgpack
+from flask import request, abort, jsonify, Response
+from flask.json import JSONEncoder
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+# values msgpack has no type for (dates, decimals, ...) become the same
+# strings jsonify produces, so both formats carry the same payload
+_json_default = JSONEncoder().default
+
+
+'''
+Wire formats
+Routes answer in JSON unless the client prefers MessagePack through its
+Accept header, and read request bodies sent as either; error responses stay
+JSON. Either format can carry list endpoints in a columnar layout
+(?layout=columns): one array per field instead of one object per row.
+'''
+
+
+def prefers_msgpack(accept):
+    if not accept:
+        return False
+    accept = parse_accept_header(accept, MIMEAccept)
+    # JSON wins ties, including "*/*"
+    return accept.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES) in MSGPACK_MIMETYPES
+
+
+def pack(payload):
+    return msgpack.packb(payload, default=_json_default, use_bin_type=True)
+
+
+def columns(rows, fields):
+    return {field: [row[field] for row in rows] for field in fields}
+
+
+def wants_columns(args):
+    return args.get('layout') == 'columns'
+
+
+# jsonify, or MessagePack when the request asks for it
+def respond(payload):
+    if prefers_msgpack(request.headers.get('Accept')):
+        response = Response(pack(payload), mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(payload)
+    response.vary.add('Accept')
+    return response
+
+
+# the request body as JSON or, with a MessagePack Content-Type, decoded
+# from MessagePack; mirrors request.get_json, aborting with 400 on a body
+# that cannot be decoded unless `silent`
+def read_body(silent=False):
+    if request.mimetype not in MSGPACK_MIMETYPES:
+        return request.get_json(silent=silent)
+    try:
+        return msgpack.unpackb(request.get_data(), raw=False)
+    except (ValueError, msgpack.UnpackException):
+        if silent:
+            return None
+        abort(400)